@@ -1,54 +1,104 @@
-from fastapi import FastAPI, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, status, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import random
 import sys
 import os
-import shutil
+import json
+import uuid
 import base64
-import subprocess
+import asyncio
+import threading
+from urllib.parse import quote
 import time
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import UploadFile, File
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, JSONResponse
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 # Import Project Modules
-from src.utils_stt import STTEngine
-from src.utils_llm import LLMEngine
+from src.utils_stt import decode_audio_bytes, find_speech, crop_to_speech
+from src.utils_stt_service import STTService
+from src.utils_llm import LLMEngine, SessionStore
 from src.utils_xtts_client import XTTSEngine
+from src.utils_pipeline import StageRunner
+from src.utils_audio import encode_audio, media_type_for
+from src.utils_text import TextChunker
+from src.utils_startup import StartupOrchestrator, launch_xtts_server, wait_for_xtts
 
 app = FastAPI()
 
 # --- Initialize Real Bot Components ---
 print("Initializing Real Bot Components...")
+
+def start_tts():
+    """Starts the XTTS server and returns a client once it reports ready (model loaded and warmed up)."""
+    global xtts_process
+    xtts_process = launch_xtts_server()
+    wait_for_xtts(xtts_process)
+    return XTTSEngine()
+
+# Components load concurrently in the background so the API is up immediately;
+# requests block on a component until it is ready (see /api/health).
+# LAZY_COMPONENTS (e.g. "stt") defers loading to the first request.
+xtts_process = None
+startup = StartupOrchestrator()
 # Force CPU for stability due to apparent cuDNN conflicts causing core dumps on this machine
 # Using CUDA for STT as requested
-stt = STTEngine(device="cuda", compute_type="float16")
-llm = LLMEngine()
-
-# Start XTTS Server (logic from bot.py)
-print("Starting XTTS Server...")
-# Reuse logic to find python and script
-# Assuming running from root
-server_script = "src/xtts_server.py"
-if not os.path.exists(server_script):
-    server_script = "../src/xtts_server.py" 
-
-python_exec = sys.executable
-# Simple subprocess start
-xtts_process = subprocess.Popen(
-    [python_exec, server_script],
-    stdout=sys.stdout,
-    stderr=sys.stderr
+# Pool of Whisper workers (STT_WORKERS) that batch concurrent short utterances
+startup.add("stt", lambda: STTService.from_env(device="cuda", compute_type="float16"))
+startup.add("llm", LLMEngine)
+startup.add("tts", start_tts)
+startup.start()
+stt_service = startup.proxy("stt")
+llm = startup.proxy("llm")
+tts = startup.proxy("tts")
+# Per-user conversation state (context + language), shared LLMEngine only holds config
+sessions = SessionStore(
+    ttl_seconds=int(os.getenv("LLM_SESSION_TTL", "1800")),
+    max_context_tokens=int(os.getenv("LLM_MAX_CONTEXT_TOKENS", "2048"))
 )
-# Wait briefly for startup
-time.sleep(5) 
-tts = XTTSEngine()
+
+# Blocking stages run on their own bounded pools so the event loop stays free
+# (STT has its own worker pool in STTService)
+stages = StageRunner({
+    "decode": int(os.getenv("DECODE_CONCURRENCY", "2")),
+    "llm": int(os.getenv("LLM_CONCURRENCY", "4")),
+    "tts": int(os.getenv("TTS_CONCURRENCY", "4")),
+    "codec": int(os.getenv("CODEC_CONCURRENCY", "2")),
+})
+
+class AudioStore:
+    """Short-lived in-memory store for synthesized replies served from /api/audio/{id}."""
+    def __init__(self, ttl_seconds=300, max_items=256):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def put(self, audio_bytes, media_type):
+        audio_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self.lock:
+            for key in [k for k, v in self.items.items() if v[2] < now]:
+                del self.items[key]
+            while len(self.items) >= self.max_items:
+                del self.items[next(iter(self.items))]
+            self.items[audio_id] = (audio_bytes, media_type, now + self.ttl_seconds)
+        return audio_id
+
+    def get(self, audio_id):
+        with self.lock:
+            item = self.items.get(audio_id)
+        if item is None or item[2] < time.monotonic():
+            return None
+        return item[0], item[1]
+
+audio_store = AudioStore(ttl_seconds=int(os.getenv("AUDIO_STORE_TTL", "300")))
 
 
 # Allow CORS for React frontend
@@ -163,59 +213,144 @@ async def chat(req: ChatRequest):
     ]
     return {"response": random.choice(responses)}
 
+@app.get("/api/health")
+async def get_health():
+    """Per-component readiness; 503 until every eagerly loaded component is up."""
+    body = {"ready": startup.ready, "components": startup.status()}
+    return JSONResponse(body, status_code=200 if startup.ready else 503)
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Queueing and latency numbers of the voice pipeline."""
+    return {
+        "stt": stt_service.stats() if startup.is_ready("stt") else None,
+        "stages": stages.stats()
+    }
+
+@app.get("/api/audio/{audio_id}")
+async def get_audio(audio_id: str):
+    item = audio_store.get(audio_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+    audio_bytes, media_type = item
+    return Response(content=audio_bytes, media_type=media_type)
+
+def decode_speech(data, audio_format="webm"):
+    """
+    Decodes an upload in memory and crops it to the speech Silero finds, so
+    Whisper gets the smallest array and never runs its own VAD pass.
+    Blocking; runs on the decode stage.
+    """
+    audio = decode_audio_bytes(data, audio_format)
+    return crop_to_speech(audio, find_speech(audio))
+
+async def transcribe_upload(data, language, audio_format="webm"):
+    """Decodes uploaded audio in memory and transcribes it on the STT worker pool."""
+    print(f"Transcribing {len(data)} bytes ({audio_format}) with hint [{language}]...")
+    audio = await stages.run("decode", decode_speech, data, audio_format)
+    if len(audio) == 0:
+        print("No speech in upload")
+        return "", language
+    # Use the provided language hint for better accuracy
+    service = await startup.get_async("stt")
+    result = await asyncio.wrap_future(service.submit(audio, language, presegmented=True))
+    print(f"User ({result.language}): {result.text} "
+          f"[{result.tier}, queue {result.queue_wait_s * 1000:.0f} ms, decode {result.decode_s * 1000:.0f} ms, batch {result.batch_size}]")
+    return result.text, result.language
+
+def synthesize_speech(text, lang):
+    """Blocking TTS call for the tts stage (waits for the XTTS server if it is still starting)."""
+    # Whole WAVs go through /synthesize so concurrent sessions share batched GPT passes
+    # Speed 1.5 for faster response, slightly lower temperature for stability/naturalness
+    return tts.synthesize_audio(text, lang=lang, stream=False, speed=1.5, temperature=0.7)
+
+def generate_reply(user_text, session):
+    """Runs one LLM turn for a session. Blocking; the session lock serializes turns per user."""
+    with session.lock:
+        return "".join(llm.chat(user_text, session=session))
+
+def stream_reply(user_text, session):
+    """Like generate_reply, but yields tokens as Ollama streams them."""
+    with session.lock:
+        yield from llm.chat(user_text, session=session)
+
 @app.post("/api/voice-chat")
 async def voice_chat(
     file: UploadFile = File(...), 
     username: str = Form("guest"), 
-    language: str = Form("en")
+    language: str = Form("en"),
+    session_id: Optional[str] = Form(None),
+    audio_format: str = Form("webm"),
+    response_format: str = Form("json"),
+    audio_codec: str = Form("wav"),
+    audio_bitrate: str = Form("32k")
 ):
+    """
+    audio_format: "webm" (default, any container PyAV can decode) or
+    "pcm16" for raw 16 kHz mono int16 samples, which skips decoding entirely.
+    response_format: "json" (audio inlined as base64), "url" (JSON with an
+    audio_url to fetch the binary audio from) or "binary" (the audio itself
+    as the body, texts in URL-encoded X-User-Text / X-Bot-Text headers).
+    audio_codec: "wav" (24 kHz int16), "opus" or "mp3" at audio_bitrate.
+    """
+    if response_format not in ("json", "url", "binary"):
+        raise HTTPException(status_code=400, detail=f"Unsupported response_format: {response_format}")
     try:
-        # 1. Save Uploaded Audio
-        temp_filename = f"temp_{random.randint(0, 100000)}.webm" # Browser usually sends webm/ogg
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # 2. STT (Transcribe)
-        print(f"Transcribing {temp_filename} with hint [{language}]...")
-        # STT engine expects path or file-like. We give path.
-        # Use the provided language hint for better accuracy
-        user_text, detected_lang = stt.transcribe(temp_filename, language=language)
-        print(f"User ({detected_lang}): {user_text}")
-        
-        # Cleanup input file
-        os.remove(temp_filename)
+        media_type_for(audio_codec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # 1 + 2. Decode Uploaded Audio in memory and Transcribe
+        user_text, detected_lang = await transcribe_upload(await file.read(), language, audio_format)
         
         if not user_text.strip():
-            return {"user_text": "", "bot_text": "I didn't hear anything.", "audio_base64": None}
+            if response_format == "binary":
+                return Response(status_code=204, headers={"X-User-Text": "", "X-Bot-Text": quote("I didn't hear anything.")})
+            return {"user_text": "", "bot_text": "I didn't hear anything.", "audio_base64": None, "audio_url": None}
 
         # 3. LLM (Generate Response)
         # FORCE the language to match selection
         target_lang = language 
-        
-        if target_lang == "tr":
-            llm.set_language("tr")
-        else:
-            llm.set_language("en")
+        session = sessions.get(session_id or username, target_lang)
             
-        bot_response = ""
         # Accumulate streaming response
-        for token in llm.chat(user_text):
-            bot_response += token
+        bot_response = await stages.run("llm", generate_reply, user_text, session)
             
         print(f"Bot: {bot_response}")
         
         # 4. TTS (Synthesize)
-        # Speed 1.5 for faster response, slightly lower temperature for stability/naturalness
-        audio_bytes = tts.synthesize_audio(bot_response, lang=target_lang, speed=1.5, temperature=0.7)
-        
+        audio_bytes = await stages.run("tts", synthesize_speech, bot_response, target_lang)
+        media_type = media_type_for(audio_codec)
+        if audio_bytes:
+            audio_bytes, media_type = await stages.run("codec", encode_audio, audio_bytes, audio_codec, audio_bitrate)
+
+        if response_format == "binary":
+            return Response(
+                content=audio_bytes or b"",
+                media_type=media_type,
+                headers={
+                    "X-User-Text": quote(user_text),
+                    "X-Bot-Text": quote(bot_response),
+                    "X-Language": target_lang,
+                    "Access-Control-Expose-Headers": "X-User-Text, X-Bot-Text, X-Language"
+                }
+            )
+
         audio_b64 = None
+        audio_url = None
         if audio_bytes:
-            audio_b64 = base64.b64encode(audio_bytes).decode('utf-8')
+            if response_format == "url":
+                audio_url = f"/api/audio/{audio_store.put(audio_bytes, media_type)}"
+            else:
+                audio_b64 = base64.b64encode(audio_bytes).decode('utf-8')
             
         return {
             "user_text": user_text, 
             "bot_text": bot_response, 
             "audio_base64": audio_b64,
+            "audio_url": audio_url,
+            "audio_media_type": media_type,
             "language": target_lang
         }
         
@@ -223,6 +358,153 @@ async def voice_chat(
         print(f"Voice Chat Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def cancel_tasks(tasks):
+    """Cancels tasks and waits for them, so none outlives the caller or leaves an unretrieved exception."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def parse_control(message):
+    """The JSON object in a text frame; None for binary frames or malformed text."""
+    if message.get("text") is None:
+        return None
+    try:
+        data = json.loads(message["text"])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+@app.websocket("/api/voice-chat/ws")
+async def voice_chat_ws(websocket: WebSocket):
+    """
+    Streaming voice chat. Per turn the client sends a JSON
+    {"type": "start", "username", "language", "session_id"?, "format"?} message,
+    the recorded audio as binary frames and then {"type": "end"}. "format" is
+    "webm" (default) or "pcm16" (raw 16 kHz mono int16); optional "codec"
+    ("wav", "opus", "mp3") and "bitrate" select the audio encoding. The server
+    answers with:
+      {"type": "transcript", "text", "language"}  as soon as STT finishes
+      {"type": "token", "text"}                   for every LLM token
+      {"type": "audio", "index", "text", "media_type"}  followed by one binary audio frame per sentence
+      {"type": "done", "bot_text"}                when the turn is complete
+    Text is split with TextChunker and each chunk is synthesized while the LLM
+    is still generating, so the first one can be played before the answer is complete.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+
+    async def receive():
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        return message
+
+    async def send_json(message):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def send_error(detail):
+        """Reports a failure to the client; ends the session if the socket is already gone."""
+        try:
+            await send_json({"type": "error", "detail": detail})
+        except Exception as e:
+            # RuntimeError / ConnectionClosed once the client has left
+            raise WebSocketDisconnect(1006) from e
+
+    async def synthesize_sentence(sentence, lang, codec, bitrate):
+        audio_bytes = await stages.run("tts", synthesize_speech, sentence, lang)
+        if not audio_bytes:
+            return None, None
+        return await stages.run("codec", encode_audio, audio_bytes, codec, bitrate)
+
+    async def send_audio(index, sentence, audio_task):
+        audio_bytes, media_type = await audio_task
+        if not audio_bytes:
+            return
+        # Header and payload must stay adjacent, so send both under the lock
+        async with send_lock:
+            await websocket.send_json({"type": "audio", "index": index, "text": sentence, "media_type": media_type})
+            await websocket.send_bytes(audio_bytes)
+
+    try:
+        while True:
+            start = parse_control(await receive())
+            if start is None or start.get("type") != "start":
+                await send_error("Expected a start message")
+                continue
+            username = start.get("username", "guest")
+            target_lang = start.get("language", "en")
+            session_id = start.get("session_id")
+            audio_format = start.get("format", "webm")
+            codec = start.get("codec", "wav")
+            bitrate = start.get("bitrate", "32k")
+
+            # Collect audio until the end marker
+            audio = bytearray()
+            while True:
+                message = await receive()
+                if message.get("bytes"):
+                    audio.extend(message["bytes"])
+                elif (parse_control(message) or {}).get("type") == "end":
+                    break
+
+            # Synthesis and sender tasks of this turn, cancelled if it ends early
+            turn_tasks = []
+            try:
+                media_type_for(codec) # Reject unknown codecs before doing any work
+                user_text, detected_lang = await transcribe_upload(bytes(audio), target_lang, audio_format)
+                await send_json({"type": "transcript", "text": user_text, "language": detected_lang})
+                if not user_text.strip():
+                    await send_json({"type": "done", "bot_text": ""})
+                    continue
+
+                session = sessions.get(session_id or username, target_lang)
+
+                # Audio is sent in sentence order by a single sender chain,
+                # while synthesis of later sentences runs concurrently.
+                sender = None
+                index = 0
+                bot_response = ""
+                chunker = TextChunker(target_lang)
+
+                def queue_sentence(sentence, position, previous):
+                    audio_task = asyncio.create_task(synthesize_sentence(sentence, target_lang, codec, bitrate))
+                    async def chain():
+                        if previous:
+                            await previous
+                        await send_audio(position, sentence, audio_task)
+                    send_task = asyncio.create_task(chain())
+                    turn_tasks.extend((audio_task, send_task))
+                    return send_task
+
+                async for token in stages.iterate("llm", stream_reply, user_text, session):
+                    bot_response += token
+                    await send_json({"type": "token", "text": token})
+                    for chunk in chunker.feed(token):
+                        sender = queue_sentence(chunk, index, sender)
+                        index += 1
+
+                for chunk in chunker.flush():
+                    sender = queue_sentence(chunk, index, sender)
+                    index += 1
+                if sender:
+                    await sender
+
+                print(f"Bot: {bot_response}")
+                await send_json({"type": "done", "bot_text": bot_response})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"Voice Chat WS Error: {e}")
+                # No audio of the failed turn may follow the error message
+                await cancel_tasks(turn_tasks)
+                await send_error(str(e))
+            finally:
+                # Nothing from this turn may keep synthesizing or sending into
+                # the next turn or to a closed socket
+                await cancel_tasks(turn_tasks)
+    except WebSocketDisconnect:
+        print("Voice chat websocket closed")
 
 # --- Serve Frontend (SPA) ---
 # Determine path to frontend build
@@ -208,6 +208,8 @@ const VoiceBot = ({ user }) => {
         formData.append("file", audioBlob, "recording.webm");
         formData.append("username", user.username);
         formData.append("language", selectedLanguageRef.current);
+        // Fetch audio as a separate binary resource instead of base64 in the JSON
+        formData.append("response_format", "url");
 
         try {
             // Fake delay for better UX on super fast responses? Optional.
@@ -217,7 +219,7 @@ const VoiceBot = ({ user }) => {
 
             if (!activeSessionCheck()) return;
 
-            const { user_text, bot_text, audio_base64 } = res.data;
+            const { user_text, bot_text, audio_base64, audio_url } = res.data;
 
             if (user_text) {
                 retryCountRef.current = 0;
@@ -237,9 +239,11 @@ const VoiceBot = ({ user }) => {
                 setMessages(prev => [...prev, { role: 'bot', text: bot_text }]);
             }
 
-            if (audio_base64) {
+            if (audio_url || audio_base64) {
                 setBotState("speaking");
-                const audio = new Audio(`data:audio/wav;base64,${audio_base64}`);
+                const audio = new Audio(audio_url
+                    ? `http://localhost:8000${audio_url}`
+                    : `data:audio/wav;base64,${audio_base64}`);
                 activeAudioRef.current = audio;
 
                 audio.onended = () => {
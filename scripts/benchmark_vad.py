@@ -0,0 +1,89 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+import wave
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+SAMPLE_RATE = 16000
+FRAME = 512
+
+def load_audio(path, seconds):
+    """16 kHz mono WAV if given, otherwise low-level noise (the model cost doesn't depend on content)."""
+    if path:
+        with wave.open(path, "rb") as wav:
+            data = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        return data.astype(np.float32) / 32768.0
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 0.01).astype(np.float32)
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q)) * 1000
+
+def run(backend, audio, streams):
+    os.environ["VAD_BACKEND"] = backend
+    from utils_vad import VADDetector
+
+    started = time.perf_counter()
+    vad = VADDetector(backend=backend)
+    load_s = time.perf_counter() - started
+
+    usable = len(audio) - len(audio) % FRAME
+    frames = audio[:usable].reshape(-1, FRAME)
+    for frame in frames[:20]: # Warm up
+        vad.is_speech(frame)
+
+    # Live path: one frame per call, as the bot loop does
+    latencies = []
+    for frame in frames:
+        t0 = time.perf_counter()
+        vad.is_speech(frame)
+        latencies.append(time.perf_counter() - t0)
+
+    # Offline path: the whole file in one call
+    t0 = time.perf_counter()
+    vad.speech_probs(audio[:usable], vad.create_stream())
+    sequence_s = time.perf_counter() - t0
+
+    # Server path: one frame for each of `streams` sessions per call
+    ids = [vad.create_stream() for _ in range(streams)]
+    steps = min(len(frames), 200)
+    t0 = time.perf_counter()
+    for i in range(steps):
+        vad.speech_probs_batch(np.repeat(frames[i:i + 1], streams, axis=0), ids)
+    batch_s = time.perf_counter() - t0
+
+    audio_s = usable / SAMPLE_RATE
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"[{backend}] load {load_s:.2f}s, max RSS {max_rss_mb:.0f} MB")
+    print(f"[{backend}] is_speech per frame: p50 {percentile_ms(latencies, 50):.3f} ms, p95 {percentile_ms(latencies, 95):.3f} ms")
+    print(f"[{backend}] speech_probs: {audio_s / sequence_s:.0f}x realtime")
+    print(f"[{backend}] speech_probs_batch ({streams} streams): {batch_s / steps * 1000:.3f} ms per step, "
+          f"{batch_s / steps / streams * 1000:.3f} ms per stream-frame")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Silero VAD backends")
+    parser.add_argument("--backend", choices=["torch", "onnx", "all"], default="all")
+    parser.add_argument("--wav", help="16 kHz mono WAV to score (default: 30 s of noise)")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--streams", type=int, default=32, help="Concurrent streams for the batch test")
+    args = parser.parse_args()
+
+    if args.backend == "all":
+        # Separate processes so load time and resident memory are measured independently
+        for backend in ("torch", "onnx"):
+            command = [sys.executable, __file__, "--backend", backend, "--seconds", str(args.seconds), "--streams", str(args.streams)]
+            if args.wav:
+                command += ["--wav", args.wav]
+            subprocess.run(command, cwd=ROOT)
+        return
+
+    run(args.backend, load_audio(args.wav, args.seconds), args.streams)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
 import os
+import urllib.request
 from huggingface_hub import snapshot_download
 
 # Configuration
 MODEL_ID = "coqui/XTTS-v2"
-MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "xtts_v2")
+MODELS_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+MODEL_DIR = os.path.join(MODELS_ROOT, "xtts_v2")
+SILERO_VAD_URL = "https://github.com/snakers4/silero-vad/raw/master/src/silero_vad/data/silero_vad.onnx"
+SILERO_VAD_PATH = os.path.join(MODELS_ROOT, "silero_vad", "silero_vad.onnx")
+
+def download_silero_vad():
+    """Fetches the Silero VAD ONNX model used by VAD_BACKEND=onnx."""
+    if os.path.exists(SILERO_VAD_PATH):
+        print(f"Silero VAD already present at {SILERO_VAD_PATH}")
+        return
+    print(f"Downloading Silero VAD to {SILERO_VAD_PATH}...")
+    os.makedirs(os.path.dirname(SILERO_VAD_PATH), exist_ok=True)
+    try:
+        urllib.request.urlretrieve(SILERO_VAD_URL, SILERO_VAD_PATH + ".part")
+        os.replace(SILERO_VAD_PATH + ".part", SILERO_VAD_PATH)
+        print("Silero VAD download complete!")
+    except Exception as e:
+        print(f"Error downloading Silero VAD: {e}")
+        exit(1)
 
 def main():
     print(f"Downloading {MODEL_ID} to {MODEL_DIR}...")
@@ -22,5 +41,7 @@ def main():
         print(f"Error downloading model: {e}")
         exit(1)
 
+    download_silero_vad()
+
 if __name__ == "__main__":
     main()
@@ -17,8 +17,8 @@ fi
 
 # Check for XTTS v2 model
 XTTS_MODEL_DIR="models/xtts_v2"
-if [ ! -d "$XTTS_MODEL_DIR" ] || [ -z "$(ls -A $XTTS_MODEL_DIR)" ]; then
-    echo "Downloading XTTS model..."
+if [ ! -d "$XTTS_MODEL_DIR" ] || [ -z "$(ls -A $XTTS_MODEL_DIR)" ] || [ ! -f "models/silero_vad/silero_vad.onnx" ]; then
+    echo "Downloading XTTS and Silero VAD models..."
     python scripts/download_models.py
 fi
 
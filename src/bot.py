@@ -3,14 +3,17 @@ import numpy as np
 import threading
 import queue
 import time
-import sys
 import os
 from colorama import Fore, Style, init
 
 from utils_vad import VADDetector
-from utils_stt import STTEngine
-from utils_llm import LLMEngine
-from utils_xtts_client import XTTSEngine
+from utils_stt import create_stt_engine, StreamingTranscriber
+from utils_llm import LLMEngine, SpeculativeReply
+from utils_xtts_client import XTTSEngine, SpeechPipeline
+from utils_endpoint import Endpointer
+from utils_text import TextChunker
+from utils_capture import AudioCapture, create_source
+from utils_startup import StartupOrchestrator, launch_xtts_server, wait_for_xtts
 import time
 import subprocess
 import signal
@@ -21,55 +24,51 @@ init()
 # Constants
 SAMPLE_RATE = 16000
 BLOCK_SIZE = 512 # ~32ms
-SILENCE_THRESHOLD_MS = 1000 # 1 second of silence to stop recording
+SILENCE_THRESHOLD_MS = 1000 # 1 second of silence to stop recording (language selection)
+ENDPOINT_MIN_MS = int(os.getenv("ENDPOINT_MIN_MS", "300")) # Adaptive end-of-turn window
+ENDPOINT_MAX_MS = int(os.getenv("ENDPOINT_MAX_MS", str(SILENCE_THRESHOLD_MS)))
+STREAMING_STT = os.getenv("STREAMING_STT", "1") == "1" # Decode partial windows while the user speaks
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "1") == "1" # Start STT + LLM as soon as the user pauses
+MIN_SPECULATION_MS = 300 # Don't speculate on very short blips
+# Pause needed before speculating; shorter VAD dips between words would each start an STT + LLM run
+SPECULATION_PAUSE_MS = int(os.getenv("SPECULATION_PAUSE_MS", "200"))
+TRAILING_PAD_MS = 200 # Silence kept after the last speech frame when handing audio to Whisper
+TTS_LOOKAHEAD = int(os.getenv("TTS_LOOKAHEAD", "2")) # Sentences synthesized ahead of playback
+CAPTURE_BUFFER_SECONDS = float(os.getenv("CAPTURE_BUFFER_SECONDS", "10")) # Audio kept while the loop is busy
 
 class VoiceBot:
     def __init__(self):
         print(Fore.CYAN + "Initializing Voice Bot..." + Style.RESET_ALL)
         
-        # Initialize Components
-        self.vad = VADDetector()
-        
-        # Load STT
-        self.stt = STTEngine()
-        
-        # Load LLM
-        self.llm = LLMEngine()
-        
-        # Start XTTS Server
-        print(Fore.CYAN + "Starting XTTS Server..." + Style.RESET_ALL)
-        self.cleanup_port(8002) # Cleanup previous instances
-        # We assume running from root
-        server_script = "src/xtts_server.py"
-        if not os.path.exists(server_script):
-             # Fallback if running from src
-             server_script = "xtts_server.py"
-
-        # Determine Python Executable for XTTS Server
-        # Check for dedicated venv first, otherwise use current interpreter
-        xtts_venv_python = os.path.join(os.getcwd(), ".venv_xtts", "bin", "python")
-        if os.path.exists(xtts_venv_python):
-             python_exec = xtts_venv_python
-             print(Fore.CYAN + f"Using dedicated XTTS env: {python_exec}" + Style.RESET_ALL)
-        else:
-             python_exec = sys.executable
-             print(Fore.CYAN + f"Using current python: {python_exec}" + Style.RESET_ALL)
-
-        self.xtts_server_process = subprocess.Popen(
-            [python_exec, server_script],
-            stdout=sys.stdout,
-            stderr=sys.stderr
-        )
-        # Wait for server to warm up (smart wait)
-        self.wait_for_server()
-        
+        # Load components concurrently; LAZY_COMPONENTS (e.g. "stt") defers them to first use
+        self.xtts_server_process = None
+        self.startup = StartupOrchestrator()
+        self.startup.add("vad", VADDetector)
+        self.startup.add("stt", create_stt_engine) # Tiered when STT_FAST_MODEL is set
+        self.startup.add("llm", LLMEngine)
+        self.startup.add("tts", self.start_xtts_server)
+        self.startup.start()
 
-        self.tts = XTTSEngine()
+        self.stt = self.startup.proxy("stt")
+        self.llm = self.startup.proxy("llm")
+        self.tts = self.startup.proxy("tts")
+        self.vad = self.startup.get("vad") # Needed right away for the endpointer
+        self.startup.wait()
+        print(Fore.GREEN + f"Component status: {self.startup.status()}" + Style.RESET_ALL)
         
         self.speech_buffer = [] # List of numpy arrays
+        self.transcriber = None # StreamingTranscriber for the current utterance
+        self.speculation = None # SpeculativeReply started at the last pause
+        self.endpointer = Endpointer(
+            min_silence_ms=ENDPOINT_MIN_MS,
+            max_silence_ms=ENDPOINT_MAX_MS,
+            frame_ms=(BLOCK_SIZE / SAMPLE_RATE) * 1000,
+            threshold=self.vad.threshold,
+            log_path=os.getenv("ENDPOINT_LOG")
+        )
         self.silence_counter = 0
         self.in_speech_phase = False
-        self.record_process = None
+        self.capture = None # AudioCapture, started on first use
         self.session_language = None # "en" or "tr"
         
         # Interruption & Threading Flags
@@ -98,17 +97,15 @@ class VoiceBot:
             # We need to capture one turn
             # For simplicity, we can block read until speech
             # This is complex to reuse the async loop logic. 
-            # We'll just run a mini-loop here using the same record_process if active
+            # We'll just run a mini-loop here using the same capture if active
             
             # Start recording if not started
-            if self.record_process is None:
+            if self.capture is None:
                 self.start_recording()
                 
-            raw_data = self.record_process.stdout.read(BLOCK_SIZE * 2)
-            if not raw_data: break
-            
-            audio_int16 = np.frombuffer(raw_data, dtype=np.int16)
-            audio_float32 = audio_int16.astype(np.float32) / 32768.0
+            frame = self.capture.read()
+            if frame is None: break
+            audio_float32 = frame.samples
             
             is_speech, _ = self.vad.is_speech(audio_float32, sr=SAMPLE_RATE)
             
@@ -123,9 +120,9 @@ class VoiceBot:
                     
                     if self.silence_counter > SILENCE_THRESHOLD_MS:
                         # Process selection
-                        full_audio = np.concatenate(self.speech_buffer)
-                        text, lang = self.stt.transcribe(full_audio)
-                        print(f"Detected: {text} ({lang})")
+                        full_audio = self.speech_audio()
+                        text, lang, tier = self.stt.transcribe_with_tier(full_audio, presegmented=True)
+                        print(f"Detected: {text} ({lang}, {tier})")
                         
                         text_lower = text.lower()
                         if "english" in text_lower or lang == "en":
@@ -138,21 +135,23 @@ class VoiceBot:
                              self.tts.speak("I didn't understand. Please say English or Türkçe.", lang="en")
                         
                         self.reset_state(quiet=True)
+                        # Drop what was captured while the bot was answering
+                        self.capture.clear()
                         if self.session_language:
                             # Update LLM
                             self.llm.set_language(self.session_language)
+                            self.endpointer.language = self.session_language
                             return
 
     def start_recording(self):
-        try:
-            self.record_process = subprocess.Popen(
-                ["arecord", "-f", "S16_LE", "-r", str(SAMPLE_RATE), "-c", "1", "-t", "raw", "-q"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=BLOCK_SIZE * 2
-            )
-        except Exception as e:
-            print(f"Error starting arecord: {e}")
+        source = create_source(SAMPLE_RATE, BLOCK_SIZE)
+        self.capture = AudioCapture(source, SAMPLE_RATE, BLOCK_SIZE, buffer_seconds=CAPTURE_BUFFER_SECONDS).start()
+
+    def stop_recording(self):
+        if self.capture:
+            print(f"Capture stats: {self.capture.stats()}")
+            self.capture.stop()
+            self.capture = None
 
     def process_loop(self):
         # 1. Select Language
@@ -160,18 +159,15 @@ class VoiceBot:
         
         print(Fore.GREEN + f"Bot is ready ({self.session_language})! Speak into the microphone." + Style.RESET_ALL)
         
-        if self.record_process is None:
+        if self.capture is None:
              self.start_recording()
 
         while True:
-            # Read raw bytes
-            raw_data = self.record_process.stdout.read(BLOCK_SIZE * 2)
-            if not raw_data or len(raw_data) < BLOCK_SIZE * 2:
+            # Frames arrive already converted to float32 from the capture thread
+            frame = self.capture.read()
+            if frame is None:
                 break
-
-            # Convert to float32 for VAD
-            audio_int16 = np.frombuffer(raw_data, dtype=np.int16)
-            audio_float32 = audio_int16.astype(np.float32) / 32768.0
+            audio_float32 = frame.samples
 
             # VAD Check
             is_speech, prob = self.vad.is_speech(audio_float32, sr=SAMPLE_RATE)
@@ -199,7 +195,12 @@ class VoiceBot:
                     # We start a new speech phase IMMEDIATELY
                     self.in_speech_phase = True
                     self.silence_counter = 0
-                    self.speech_buffer = [audio_float32] # Start buffer with current chunk
+                    self.endpointer.start_turn()
+                    self.endpointer.update(prob)
+                    self.cancel_speculation()
+                    self.speech_buffer = [] # Start buffer with current chunk
+                    self.transcriber = None
+                    self.append_speech(audio_float32)
                     self.interrupt_speech_frames = 0
                     
                     # Wait for thread to acknowledge? 
@@ -210,23 +211,85 @@ class VoiceBot:
                 self.interrupt_speech_frames = 0 # Reset
                 
                 if is_speech:
+                    if not self.in_speech_phase:
+                        self.endpointer.start_turn()
+                    # User kept talking: the speculative reply is for an incomplete turn
+                    self.cancel_speculation()
                     self.in_speech_phase = True
                     self.silence_counter = 0
-                    self.speech_buffer.append(audio_float32)
+                    self.endpointer.update(prob)
+                    self.append_speech(audio_float32)
                 else:
                     if self.in_speech_phase:
+                        if self.silence_counter == 0 and self.transcriber:
+                            # User paused: get a fresh partial transcript for the endpointer
+                            self.transcriber.request_partial()
                         self.silence_counter += (BLOCK_SIZE / SAMPLE_RATE) * 1000 # ms
-                        self.speech_buffer.append(audio_float32) # Keep trailing silence
+                        self.append_speech(audio_float32, is_speech=False) # Keep trailing silence
+                        if self.silence_counter >= SPECULATION_PAUSE_MS:
+                            self.start_speculation()
                         
-                        if self.silence_counter > SILENCE_THRESHOLD_MS:
+                        partial_text, text_current = self.partial_transcript()
+                        if self.endpointer.update(prob, partial_text, text_current):
                             # User stopped speaking, valid turn
                             self.trigger_response_thread()
                             self.reset_state(quiet=True)
                             print(Fore.GREEN + "\nListening..." + Style.RESET_ALL)
     
+    def append_speech(self, chunk, is_speech=True):
+        """Adds a chunk to the current utterance and feeds the streaming transcriber."""
+        self.speech_buffer.append(chunk)
+        if STREAMING_STT:
+            if self.transcriber is None:
+                self.transcriber = StreamingTranscriber(self.stt, language=self.session_language, trailing_pad_ms=TRAILING_PAD_MS)
+            self.transcriber.feed(chunk, is_speech)
+
+    def start_speculation(self):
+        """
+        Starts STT + LLM on the audio so far once the user has paused for
+        SPECULATION_PAUSE_MS; output is held back until the turn is confirmed.
+        """
+        speech_ms = len(self.speech_buffer) * (BLOCK_SIZE / SAMPLE_RATE) * 1000
+        if not SPECULATIVE_LLM or self.speculation or speech_ms < MIN_SPECULATION_MS:
+            return
+        if self.transcriber:
+            prepare = self.transcriber.peek
+        else:
+            audio = self.speech_audio()
+            prepare = lambda: self.stt.transcribe(audio, presegmented=True)
+        self.speculation = SpeculativeReply(self.llm, prepare)
+
+    def cancel_speculation(self):
+        if self.speculation:
+            self.speculation.cancel()
+            self.speculation = None
+
+    def speech_audio(self):
+        """
+        The utterance without the trailing silence the endpointer waited
+        through. It starts at the first speech frame, so together with Silero's
+        per-frame decisions it is already segmented for Whisper.
+        """
+        frame_ms = (BLOCK_SIZE / SAMPLE_RATE) * 1000
+        trailing = int((self.silence_counter - TRAILING_PAD_MS) / frame_ms)
+        chunks = self.speech_buffer[:-trailing] if 0 < trailing < len(self.speech_buffer) else self.speech_buffer
+        return np.concatenate(chunks)
+
+    def partial_transcript(self):
+        """
+        Returns (partial text, whether it covers all speech so far).
+        Without streaming STT there is no text and the endpointer relies on audio cues.
+        """
+        if not self.transcriber:
+            return "", False
+        speech_end = self.transcriber.total_seconds - self.silence_counter / 1000
+        return self.transcriber.partial_text, self.transcriber.decoded_until >= speech_end
+
     def reset_state(self, quiet=False):
         self.in_speech_phase = False
         self.speech_buffer = []
+        self.transcriber = None # Owned by the response thread once a turn is triggered
+        self.speculation = None
         self.silence_counter = 0
         if not quiet:
             print(Fore.GREEN + "\nListening..." + Style.RESET_ALL)
@@ -235,14 +298,15 @@ class VoiceBot:
         # If a previous thread is running (unlikely if logic is correct, but possible), join it?
         # Actually, if we just finished listening, the bot shouldn't be speaking unless something weird happened.
         
-        # Prepare data
-        full_audio = np.concatenate(self.speech_buffer)
+        # Prepare data (trailing silence is wasted encoder work)
+        full_audio = self.speech_audio()
         
         # Start Thread
-        self.response_thread = threading.Thread(target=self.handle_turn_threaded, args=(full_audio,))
+        self.response_thread = threading.Thread(target=self.handle_turn_threaded, args=(full_audio, self.transcriber, self.speculation))
         self.response_thread.start()
 
-    def handle_turn_threaded(self, audio_data):
+    def handle_turn_threaded(self, audio_data, transcriber=None, speculation=None):
+        speech = None
         # Set Flag
         with self.bot_speaking_lock:
             self.is_bot_speaking = True
@@ -253,7 +317,17 @@ class VoiceBot:
             
             # STT
             print(Fore.BLUE + "Transcribing..." + Style.RESET_ALL)
-            user_text, detected_lang = self.stt.transcribe(audio_data)
+            if speculation:
+                # Transcript (and possibly the reply) were produced during the endpoint window
+                if transcriber:
+                    transcriber.close()
+                user_text, detected_lang = speculation.wait_for_text(self.interrupted_event)
+            elif transcriber:
+                # Most of the utterance is already committed, only the tail is decoded here
+                user_text, detected_lang = transcriber.finish()
+            else:
+                user_text, detected_lang, tier = self.stt.transcribe_with_tier(audio_data, presegmented=True)
+                print(Fore.BLUE + f"Transcribed by {tier}" + Style.RESET_ALL)
             
             # Check interruption (early exit)
             if self.interrupted_event.is_set(): return
@@ -267,48 +341,54 @@ class VoiceBot:
             # LLM & TTS Streaming
             print(Fore.MAGENTA + "Bot: " + Style.RESET_ALL, end="", flush=True)
             
-            current_sentence = ""
-            for token in self.llm.chat(user_text):
+            # Sentences are synthesized ahead and played back on their own threads,
+            # so the token loop never waits for audio
+            speech = SpeechPipeline(self.tts, self.session_language, self.interrupted_event, lookahead=TTS_LOOKAHEAD)
+            chunker = TextChunker(self.session_language)
+            if speculation:
+                tokens = speculation.stream(self.interrupted_event)
+            else:
+                tokens = self.llm.chat(user_text)
+            for token in tokens:
                 # Check interruption
                 if self.interrupted_event.is_set():
                     print(Fore.RED + " [Interrupted]" + Style.RESET_ALL)
                     break
 
                 print(token, end="", flush=True)
-                current_sentence += token
                 
-                # Simple heuristic for sentence end
-                if token in [".", "!", "?", "\n"]:
-                    if current_sentence.strip():
-                        self.tts.speak(current_sentence, lang=self.session_language)
-                    current_sentence = ""
+                # Abbreviation/number-aware sentence chunks sized for TTS
+                for chunk in chunker.feed(token):
+                    speech.say(chunk)
             
             # Flush remaining
-            if current_sentence.strip() and not self.interrupted_event.is_set():
-                self.tts.speak(current_sentence, lang=self.session_language)
+            if not self.interrupted_event.is_set():
+                for chunk in chunker.flush():
+                    speech.say(chunk)
+            speech.finish()
+            speech = None
+
+            if speculation and not self.interrupted_event.is_set():
+                speculation.commit()
                 
             print() # Newline
 
         except Exception as e:
             print(f"Error in response thread: {e}")
         finally:
+            if speech:
+                speech.finish() # Let already queued sentences drain on errors
+            if speculation:
+                speculation.cancel() # Stop generating if the turn was cut short
             with self.bot_speaking_lock:
                 self.is_bot_speaking = False
 
-    def wait_for_server(self, port=8002, timeout=120):
-        print(Fore.CYAN + f"Waiting for XTTS Server on port {port}..." + Style.RESET_ALL)
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                import socket
-                with socket.create_connection(("127.0.0.1", port), timeout=1):
-                    print(Fore.GREEN + "\nServer is ready!" + Style.RESET_ALL)
-                    return True
-            except (ConnectionRefusedError, OSError):
-                time.sleep(2)
-                print(".", end="", flush=True)
-        print(Fore.RED + "\nServer timed out!" + Style.RESET_ALL)
-        return False 
+    def start_xtts_server(self, port=8002):
+        """Starts the XTTS server and returns a client once it reports ready (model loaded and warmed up)."""
+        self.cleanup_port(port) # Cleanup previous instances
+        self.xtts_server_process = launch_xtts_server()
+        wait_for_xtts(self.xtts_server_process, port)
+        return XTTSEngine(f"http://127.0.0.1:{port}")
 
     def cleanup_port(self, port):
         """Kills any process listening on the specified port"""
@@ -329,18 +409,7 @@ if __name__ == "__main__":
         bot.process_loop()
     except KeyboardInterrupt:
         print("\nExiting...")
-        if bot.record_process:
-            bot.record_process.terminate()
-        if hasattr(bot, 'xtts_server_process') and bot.xtts_server_process:
-            bot.xtts_server_process.terminate()
-
-if __name__ == "__main__":
-    bot = VoiceBot()
-    try:
-        bot.process_loop()
-    except KeyboardInterrupt:
-        print("\nExiting...")
-        if bot.record_process:
-            bot.record_process.terminate()
-        if hasattr(bot, 'xtts_server_process') and bot.xtts_server_process:
+    finally:
+        bot.stop_recording()
+        if bot.xtts_server_process:
             bot.xtts_server_process.terminate()
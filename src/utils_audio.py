@@ -0,0 +1,33 @@
+import subprocess
+
+# codec -> (ffmpeg args, media type)
+CODECS = {
+    "wav": (None, "audio/wav"),
+    "opus": (["-c:a", "libopus", "-f", "ogg"], "audio/ogg"),
+    "mp3": (["-c:a", "libmp3lame", "-f", "mp3"], "audio/mpeg"),
+}
+
+def media_type_for(codec):
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported audio codec: {codec}")
+    return CODECS[codec][1]
+
+def encode_audio(wav_bytes, codec="wav", bitrate="32k"):
+    """
+    Transcodes a WAV (as produced by xtts_server) with ffmpeg.
+    Returns (audio_bytes, media_type). "wav" is returned unchanged.
+    """
+    media_type = media_type_for(codec)
+    codec_args = CODECS[codec][0]
+    if codec_args is None:
+        return wav_bytes, media_type
+
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+         *codec_args, "-b:a", bitrate, "pipe:1"],
+        input=wav_bytes,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='ignore').strip()}")
+    return result.stdout, media_type
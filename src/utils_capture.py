@@ -0,0 +1,181 @@
+import collections
+import subprocess
+import threading
+import time
+import wave
+import os
+import numpy as np
+
+AudioFrame = collections.namedtuple("AudioFrame", ["samples", "index", "captured_at"])
+AudioFrame.__doc__ = "One block of float32 mono audio, its sequence number and time.monotonic() at capture."
+
+class ArecordSource:
+    """Raw 16-bit mono PCM from the default ALSA device."""
+    def __init__(self, sample_rate, block_size):
+        self.process = subprocess.Popen(
+            ["arecord", "-f", "S16_LE", "-r", str(sample_rate), "-c", "1", "-t", "raw", "-q"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=block_size * 2
+        )
+
+    def readinto(self, buffer):
+        return self.process.stdout.readinto(buffer)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class WavFileSource:
+    """
+    Replays a 16-bit mono WAV file as if it came from the microphone, so the
+    bot loop can be driven offline. Reads are paced to real time unless
+    `realtime` is False, and `tail_silence_s` of silence is appended so the
+    last turn gets endpointed.
+    """
+    def __init__(self, path, sample_rate, realtime=True, tail_silence_s=2.0):
+        self.wav = wave.open(path, "rb")
+        if self.wav.getsampwidth() != 2 or self.wav.getnchannels() != 1 or self.wav.getframerate() != sample_rate:
+            self.wav.close()
+            raise ValueError(f"{path} must be 16-bit mono PCM at {sample_rate} Hz")
+        self.sample_rate = sample_rate
+        self.realtime = realtime
+        self.silence_left = int(tail_silence_s * sample_rate) * 2
+        self.bytes_read = 0
+        self.started_at = None
+
+    def readinto(self, buffer):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        frames = len(buffer) // 2
+        data = self.wav.readframes(frames)
+        if len(data) < len(buffer) and self.silence_left > 0:
+            padding = min(len(buffer) - len(data), self.silence_left)
+            self.silence_left -= padding
+            data += b"\x00" * padding
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        if self.realtime:
+            delay = self.started_at + self.bytes_read / 2 / self.sample_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return len(data)
+
+    def close(self):
+        self.wav.close()
+
+def create_source(sample_rate, block_size):
+    """Microphone by default; VOICEBOT_INPUT_WAV replays a file instead."""
+    path = os.getenv("VOICEBOT_INPUT_WAV")
+    if path:
+        realtime = os.getenv("VOICEBOT_INPUT_REALTIME", "1") == "1"
+        print(f"Using audio file input: {path}")
+        return WavFileSource(path, sample_rate, realtime=realtime)
+    return ArecordSource(sample_rate, block_size)
+
+class AudioCapture:
+    """
+    Reads a source on its own thread into a preallocated ring of frames.
+
+    The reader never waits for the consumer: when the ring is full the
+    oldest frame is dropped and counted in `overflows`, so a slow VAD or
+    console stall shows up as a number instead of silently backing up the
+    pipe. read() returns AudioFrame objects in order, or None once the
+    source has ended.
+    """
+    def __init__(self, source, sample_rate=16000, block_size=512, buffer_seconds=10.0):
+        self.source = source
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        slots = max(2, int(np.ceil(buffer_seconds * sample_rate / block_size)))
+        self.ring = np.zeros((slots, block_size), dtype=np.float32)
+        self.capture_times = np.zeros(slots, dtype=np.float64)
+        self.raw = bytearray(block_size * 2)
+        self.write_index = 0 # Next frame number to capture
+        self.read_index = 0 # Next frame number to hand out
+        self.overflows = 0
+        self.last_overflow_report = 0.0
+        self.ended = False
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _read_block(self):
+        """Fills self.raw completely; returns False at end of stream."""
+        view = memoryview(self.raw)
+        filled = 0
+        while filled < len(self.raw):
+            count = self.source.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def _capture_loop(self):
+        samples = np.frombuffer(self.raw, dtype=np.int16)
+        try:
+            while not self.ended and self._read_block():
+                captured_at = time.monotonic()
+                with self.lock:
+                    if self.write_index - self.read_index >= len(self.ring):
+                        # Consumer fell behind: drop the oldest frame
+                        self.read_index += 1
+                        self.overflows += 1
+                        if captured_at - self.last_overflow_report > 1.0:
+                            self.last_overflow_report = captured_at
+                            print(f"Audio capture overflow: {self.overflows} frames dropped so far")
+                    slot = self.write_index % len(self.ring)
+                    np.multiply(samples, 1 / 32768.0, out=self.ring[slot], casting="unsafe")
+                    self.capture_times[slot] = captured_at
+                    self.write_index += 1
+                    self.available.notify()
+        except (OSError, ValueError) as e:
+            if not self.ended:
+                print(f"Audio capture error: {e}")
+        finally:
+            with self.lock:
+                self.ended = True
+                self.available.notify_all()
+
+    def read(self, timeout=None):
+        """Returns the next AudioFrame, or None when the source ended (or on timeout)."""
+        with self.lock:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.read_index == self.write_index:
+                if self.ended:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.available.wait(remaining)
+            slot = self.read_index % len(self.ring)
+            frame = AudioFrame(self.ring[slot].copy(), self.read_index, self.capture_times[slot])
+            self.read_index += 1
+            return frame
+
+    def clear(self):
+        """Discards frames captured so far (e.g. while the bot was talking over the prompt)."""
+        with self.lock:
+            self.read_index = self.write_index
+
+    def stats(self):
+        with self.lock:
+            return {
+                "captured": self.write_index,
+                "queued": self.write_index - self.read_index,
+                "overflows": self.overflows,
+            }
+
+    def stop(self):
+        with self.lock:
+            self.ended = True
+            self.available.notify_all()
+        self.source.close()
@@ -0,0 +1,126 @@
+import json
+import time
+import numpy as np
+from collections import deque
+
+# Words after which a speaker usually keeps going
+CONTINUATION_WORDS = {
+    "en": {"and", "but", "or", "so", "because", "if", "then", "that", "the", "a", "to", "of", "um", "uh", "like"},
+    "tr": {"ve", "ama", "fakat", "veya", "çünkü", "yani", "ki", "eğer", "şey", "ee", "hani", "ile"},
+}
+# Turkish yes/no question particles end a question without a "?" from Whisper
+QUESTION_PARTICLES = {"mı", "mi", "mu", "mü", "mısın", "misin", "musun", "müsün", "mıyım", "miyim"}
+
+class Endpointer:
+    """
+    Adaptive end-of-turn detection.
+
+    Instead of a fixed silence timeout, the silence needed to end a turn is
+    chosen per frame between `min_silence_ms` and `max_silence_ms` from:
+      - the partial transcript: sentence-final punctuation or a question
+        ends the turn quickly, a trailing comma / conjunction / filler
+        waits the maximum,
+      - the speaker's pause history: a user who pauses long mid-sentence
+        gets a longer window,
+      - the Silero probability stream: hesitant, near-threshold frames
+        during silence (breathing, trailing off) extend the window.
+    Every decision is appended as a JSON line to `log_path` (if set) for
+    offline tuning against recorded sessions.
+    """
+    def __init__(self, min_silence_ms=300, max_silence_ms=1000, frame_ms=32, threshold=0.5,
+                 language="en", log_path=None):
+        self.min_silence_ms = min_silence_ms
+        self.max_silence_ms = max(min_silence_ms, max_silence_ms)
+        self.frame_ms = frame_ms
+        self.threshold = threshold
+        self.language = language
+        self.log_path = log_path
+        self.pause_history = deque(maxlen=50) # Intra-turn pauses (ms), kept across turns
+        self.recent_probs = deque(maxlen=5)
+        self.start_turn()
+
+    def start_turn(self):
+        self.silence_ms = 0.0
+        self.speech_ms = 0.0
+        self.turn_started = time.time()
+
+    def update(self, speech_prob, partial_text="", text_current=True):
+        """
+        Feeds one VAD frame. Returns True when the turn should end.
+        text_current: whether partial_text covers all speech so far; stale
+                      transcripts are not used as cues.
+        """
+        self.recent_probs.append(speech_prob)
+        if speech_prob > self.threshold:
+            # Speech resumed: remember how long the user paused
+            if self.silence_ms >= 2 * self.frame_ms:
+                self.pause_history.append(self.silence_ms)
+            self.silence_ms = 0.0
+            self.speech_ms += self.frame_ms
+            return False
+
+        self.silence_ms += self.frame_ms
+        if self.silence_ms < self.min_silence_ms:
+            return False
+
+        required, cue = self.required_silence_ms(partial_text if text_current else "")
+        if self.silence_ms < required:
+            return False
+
+        self._log(required, cue, partial_text)
+        return True
+
+    def required_silence_ms(self, partial_text):
+        """Returns (silence needed to end the turn in ms, cue that decided it)."""
+        text = partial_text.strip()
+        last_word = text.split()[-1].lower().strip(".,!?;:\"'") if text else ""
+
+        if text.endswith("?") or last_word in QUESTION_PARTICLES:
+            cue = "question"
+            required = self.min_silence_ms
+        elif text.endswith((".", "!")):
+            cue = "sentence_end"
+            required = self.min_silence_ms
+        elif text.endswith((",", ";", ":", "-")) or last_word in CONTINUATION_WORDS.get(self.language, set()):
+            cue = "continuation"
+            required = self.max_silence_ms
+        else:
+            cue = "none"
+            required = (self.min_silence_ms + self.max_silence_ms) / 2
+
+        # Speakers who pause long mid-sentence need a longer window
+        if len(self.pause_history) >= 3 and cue != "continuation":
+            pauses = np.array(self.pause_history)
+            if cue == "none":
+                required = max(required, 1.1 * np.percentile(pauses, 90))
+            else:
+                required = max(required, 0.75 * np.percentile(pauses, 50))
+
+        # Near-threshold probabilities: the user may just be trailing off
+        if self.recent_probs and np.mean(self.recent_probs) > 0.5 * self.threshold:
+            required *= 1.25
+            cue += "+hesitant"
+
+        required = min(max(required, self.min_silence_ms), self.max_silence_ms)
+        return required, cue
+
+    def _log(self, required, cue, partial_text):
+        pauses = list(self.pause_history)
+        record = {
+            "time": round(time.time(), 3),
+            "turn_ms": round((time.time() - self.turn_started) * 1000),
+            "speech_ms": round(self.speech_ms),
+            "silence_ms": round(self.silence_ms),
+            "required_ms": round(required),
+            "cue": cue,
+            "text_tail": partial_text.strip()[-60:],
+            "pause_p50_ms": round(float(np.percentile(pauses, 50))) if pauses else None,
+            "pause_p90_ms": round(float(np.percentile(pauses, 90))) if pauses else None,
+        }
+        print(f"[Endpoint] {record['silence_ms']}ms silence (needed {record['required_ms']}ms, cue={cue})")
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Failed to write endpoint log: {e}")
@@ -0,0 +1,46 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection settings shared by the Ollama and XTTS clients
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+
+_shared_session = None
+_shared_lock = threading.Lock()
+
+def create_session(pool_maxsize=POOL_MAXSIZE, retries=CONNECT_RETRIES, backoff_factor=RETRY_BACKOFF):
+    """
+    Returns a requests.Session with keep-alive connection pooling.
+    Only connection errors are retried (with exponential backoff): the request
+    never reached the server, so retrying a POST is safe. Up to
+    `pool_maxsize` idle connections are kept per host. A caller that finds
+    them all busy opens a one-off connection instead of waiting: requests
+    gives urllib3 no pool timeout, so a blocking pool could hang forever.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=backoff_factor,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry, pool_block=False)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_shared_session():
+    """Process-wide session so all clients reuse the same connection pools."""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
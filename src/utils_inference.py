@@ -0,0 +1,273 @@
+import threading
+import asyncio
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from utils_metrics import percentile_ms
+except ImportError:
+    from src.utils_metrics import percentile_ms
+
+_worker = threading.local()
+
+def bound_replica(default=None):
+    """The replica bound to the calling InferencePool worker thread, else `default`."""
+    return getattr(_worker, "replica", default)
+
+class QueueFullError(Exception):
+    pass
+
+class DeadlineExceededError(Exception):
+    pass
+
+class InferencePool:
+    """
+    Runs blocking model inference on a dedicated, bounded thread pool so the
+    event loop stays responsive. There is one worker thread per entry of
+    `replicas` (model instances), each bound to its own (bound_replica()).
+    At most `workers + max_queue` requests are admitted, counting both direct
+    jobs and requests waiting in a BatchScheduler; beyond that
+    admit()/submit() raise QueueFullError. Jobs still queued when their
+    deadline passes are dropped with DeadlineExceededError.
+    """
+    def __init__(self, replicas, max_queue=8, timeout=60.0, name="inference"):
+        self.workers = len(replicas)
+        self.capacity = self.workers + max(0, max_queue)
+        self.timeout = timeout
+        self.unbound = queue.Queue()
+        for replica in replicas:
+            self.unbound.put(replica)
+        # Threads start lazily, one per replica; each binds a replica once
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix=name,
+            initializer=self._bind_replica
+        )
+        self.lock = threading.Lock()
+        self.pending = 0 # Admitted requests not finished yet
+        self.running = 0 # Requests in running jobs
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.queue_waits = deque(maxlen=200)
+        self.run_times = deque(maxlen=200)
+
+    def _bind_replica(self):
+        _worker.replica = self.unbound.get_nowait()
+
+    def admit(self):
+        """Counts one request against capacity or raises QueueFullError. Pair with release()."""
+        with self.lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise QueueFullError(f"Inference queue is full ({self.pending} pending)")
+            self.pending += 1
+
+    def release(self, _future=None):
+        with self.lock:
+            self.pending -= 1
+
+    def submit(self, fn, *args, timeout=None, admitted=0):
+        """
+        Admits a job or raises QueueFullError. Returns a concurrent.futures.Future.
+        admitted: number of requests, already counted through admit(), that this
+        job serves (a batch); those are not admitted again here.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        size = admitted or 1
+        if not admitted:
+            self.admit()
+        submitted = time.monotonic()
+
+        def job():
+            started = time.monotonic()
+            if started > deadline:
+                with self.lock:
+                    self.expired += 1
+                raise DeadlineExceededError("Request expired while queued")
+            with self.lock:
+                self.running += size
+                self.queue_waits.append(started - submitted)
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                with self.lock:
+                    self.running -= size
+                    self.run_times.append(time.monotonic() - started)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        try:
+            future = self.executor.submit(job)
+        except Exception:
+            if not admitted:
+                self.release()
+            raise
+        if not admitted:
+            # Done callbacks also fire for jobs cancelled before they started
+            future.add_done_callback(self.release)
+        return future
+
+    async def run(self, fn, *args, timeout=None):
+        """Submits a job and awaits its result, bounded by the request deadline."""
+        timeout = timeout or self.timeout
+        future = self.submit(fn, *args, timeout=timeout)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError(f"Request exceeded {timeout:.0f}s deadline")
+
+    def stats(self):
+        with self.lock:
+            waits = list(self.queue_waits)
+            runs = list(self.run_times)
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "queue_depth": max(0, self.pending - self.running),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "queue_wait_ms_p50": percentile_ms(waits, 0.5),
+                "queue_wait_ms_p95": percentile_ms(waits, 0.95),
+                "inference_ms_p50": percentile_ms(runs, 0.5),
+                "inference_ms_p95": percentile_ms(runs, 0.95),
+            }
+
+
+class BatchScheduler:
+    """
+    Micro-batches requests onto an InferencePool. A dispatcher thread waits
+    for a free pool worker, collects requests for up to `max_wait_ms` (or
+    `max_batch_size` requests), groups them by `key(req)` and hands each group
+    to the pool as a single job. A group of one goes through `run_one(req)`,
+    larger groups through `run_batch(reqs)` (one result per request), falling
+    back to `run_one` per request if the batch fails. Under load batches grow
+    naturally because requests pile up while the workers are busy.
+    """
+    def __init__(self, pool, run_one, run_batch, key, max_batch_size=4, max_wait_ms=15):
+        self.pool = pool
+        self.run_one = run_one
+        self.run_batch = run_batch
+        self.key = key
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.free_workers = threading.Semaphore(pool.workers)
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.batched_requests = 0
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name="batch-dispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, req, timeout=None):
+        """Queues a request for batching. Returns a concurrent.futures.Future of its result."""
+        # Admitted against the pool's capacity until the request finishes
+        self.pool.admit()
+        future = Future()
+        future.add_done_callback(self.pool.release)
+        deadline = time.monotonic() + (timeout or self.pool.timeout)
+        self.requests.put((req, future, deadline))
+        return future
+
+    async def run(self, req, timeout=None):
+        timeout = timeout or self.pool.timeout
+        future = self.submit(req, timeout=timeout)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError(f"Request exceeded {timeout:.0f}s deadline")
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        window_end = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = window_end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            self.free_workers.acquire()
+            batch = self._collect()
+
+            groups = {}
+            now = time.monotonic()
+            for req, future, deadline in batch:
+                # Skip callers that already gave up
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if now > deadline:
+                    with self.pool.lock:
+                        self.pool.expired += 1
+                    future.set_exception(DeadlineExceededError("Request expired while queued"))
+                    continue
+                groups.setdefault(self.key(req), []).append((req, future))
+
+            if not groups:
+                self.free_workers.release()
+                continue
+
+            with self.lock:
+                self.batches += len(groups)
+                self.batched_requests += sum(len(group) for group in groups.values())
+
+            # Groups from the same window run back to back on one worker
+            job = list(groups.values())
+            try:
+                pool_future = self.pool.submit(self._run_groups, job, admitted=sum(len(group) for group in job))
+                pool_future.add_done_callback(lambda _future: self.free_workers.release())
+            except Exception as e:
+                self.free_workers.release()
+                for group in job:
+                    for _, future in group:
+                        future.set_exception(e)
+
+    def _run_groups(self, groups):
+        for group in groups:
+            reqs = [req for req, _ in group]
+            try:
+                if len(reqs) == 1:
+                    results = [self.run_one(reqs[0])]
+                else:
+                    results = self.run_batch(reqs)
+            except Exception as e:
+                if len(reqs) == 1:
+                    group[0][1].set_exception(e)
+                    continue
+                # Fall back to one request at a time so a single bad input does not fail the batch
+                print(f"Batched inference failed ({e}), falling back to sequential inference")
+                for req, future in group:
+                    try:
+                        future.set_result(self.run_one(req))
+                    except Exception as inner:
+                        future.set_exception(inner)
+                continue
+            for (_, future), wav_bytes in zip(group, results):
+                future.set_result(wav_bytes)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "queued_requests": self.requests.qsize(),
+                "batches": self.batches,
+                "avg_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else None,
+            }
+
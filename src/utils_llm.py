@@ -1,36 +1,232 @@
 import os
+import time
+import threading
 import requests
 import json
 
+try:
+    from utils_http import get_shared_session, CONNECT_TIMEOUT
+except ImportError:
+    from src.utils_http import get_shared_session, CONNECT_TIMEOUT
+
+def system_prompt_for(language):
+    if language == "tr":
+        return "Sen yardımsever bir yapay zeka asistanısın. SADECE TÜRKÇE konuş. Cevapların öz ama bilgilendirici olsun (2-3 cümle)."
+    return "You are a helpful AI assistant. Speak ONLY ENGLISH. Keep answers concise but informative (2-3 sentences)."
+
+class ChatSession:
+    """Conversation state of a single user: language, system prompt and Ollama context tokens."""
+    def __init__(self, session_id, language="en", max_context_tokens=2048):
+        self.session_id = session_id
+        self.language = language
+        self.system_prompt = system_prompt_for(language)
+        self.max_context_tokens = max_context_tokens
+        self.context = []
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock() # One turn at a time per session
+        self.response = None # In-flight Ollama stream, closed by abort()
+        self.aborted = False
+
+    def set_language(self, language):
+        if language != self.language:
+            self.language = language
+            self.system_prompt = system_prompt_for(language)
+
+    def update_context(self, context):
+        """Stores the context returned by Ollama, keeping only the most recent tokens."""
+        if self.max_context_tokens and len(context) > self.max_context_tokens:
+            context = context[-self.max_context_tokens:]
+        self.context = context
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def abort(self):
+        """Ends the session's in-flight generation (callable from any thread); later chat() calls return at once."""
+        self.aborted = True
+        response = self.response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+class SpeculativeReply:
+    """
+    Generates a reply in the background before the turn is confirmed.
+
+    `prepare` (e.g. STT on the audio so far) runs first and must return
+    (user_text, language). Tokens are buffered, not shown or spoken, and the
+    generation works on a detached copy of the conversation state, so a
+    cancelled speculation leaves no trace. commit() adopts the new context
+    once the reply has been used.
+    """
+    def __init__(self, llm, prepare):
+        self.llm = llm
+        self.session = llm.detached_session()
+        self.prepare = prepare
+        self.user_text = None
+        self.language = None
+        self.tokens = []
+        self.finished = False
+        self.completed = False # Generation reached Ollama's "done" (context is valid)
+        self.error = None
+        self.cancelled = threading.Event()
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            if self.cancelled.is_set():
+                return # Cancelled before STT started
+            user_text, language = self.prepare()
+            with self.cond:
+                self.user_text, self.language = user_text, language
+                self.cond.notify_all()
+            if self.cancelled.is_set() or not user_text.strip():
+                return
+            for token in self.llm.chat(user_text, session=self.session):
+                if self.cancelled.is_set():
+                    return
+                with self.cond:
+                    self.tokens.append(token)
+                    self.cond.notify_all()
+            self.completed = True
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.error = e
+        finally:
+            with self.cond:
+                self.finished = True
+                self.cond.notify_all()
+
+    def cancel(self):
+        """Discards the reply and aborts the Ollama request if it is already streaming."""
+        self.cancelled.set()
+        self.session.abort()
+
+    def wait_for_text(self, stop_event=None):
+        """Blocks until the transcript is ready. Returns (user_text, language)."""
+        with self.cond:
+            while self.user_text is None and not self.finished:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                self.cond.wait(timeout=0.05)
+        if self.error:
+            raise self.error
+        return self.user_text or "", self.language
+
+    def stream(self, stop_event=None):
+        """Yields buffered tokens, then new ones as they arrive."""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.tokens) and not self.finished:
+                    if stop_event is not None and stop_event.is_set():
+                        return
+                    self.cond.wait(timeout=0.05)
+                if index >= len(self.tokens):
+                    break
+                token = self.tokens[index]
+            index += 1
+            yield token
+        if self.error:
+            raise self.error
+
+    def commit(self):
+        """Adopts the speculative conversation state into the engine."""
+        if self.completed:
+            self.llm.context = self.session.context
+
+class SessionStore:
+    """
+    Per-user chat sessions with idle-TTL eviction.
+    Keeps each user's prompt size bounded instead of sharing one growing context.
+    """
+    def __init__(self, ttl_seconds=1800, max_context_tokens=2048, max_sessions=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_context_tokens = max_context_tokens
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, session_id, language="en"):
+        """Returns the session for `session_id`, creating it if needed."""
+        with self.lock:
+            self._evict_expired()
+            session = self.sessions.get(session_id)
+            if session is None:
+                if len(self.sessions) >= self.max_sessions:
+                    # Drop the least recently used session
+                    oldest = min(self.sessions.values(), key=lambda s: s.last_used)
+                    del self.sessions[oldest.session_id]
+                session = ChatSession(session_id, language, self.max_context_tokens)
+                self.sessions[session_id] = session
+            session.set_language(language)
+            session.touch()
+            return session
+
+    def drop(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [sid for sid, s in self.sessions.items() if now - s.last_used > self.ttl_seconds]
+        for sid in expired:
+            del self.sessions[sid]
+        if expired:
+            print(f"Evicted {len(expired)} idle chat session(s)")
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
 class LLMEngine:
     def __init__(self, model_name="qwen2.5", system_prompt="You are a helpful AI assistant. IMPORTANT: DETECT the user's language. If they speak Turkish, answer ONLY in Turkish. If they speak English, answer ONLY in English. Do not mix languages. Keep answers short, natural, and conversational."):
         self.model_name = model_name
         self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/api/generate")
         self.system_prompt = system_prompt
         self.context = [] # Maintain context if needed, or use 'context' param from Ollama
+        self.session = get_shared_session()
+        # Read timeout is the max gap between streamed lines (covers prompt prefill)
+        self.timeout = (CONNECT_TIMEOUT, float(os.getenv("OLLAMA_READ_TIMEOUT", "120")))
+
+    def detached_session(self):
+        """A ChatSession carrying a copy of the engine's own prompt and context."""
+        session = ChatSession("detached", max_context_tokens=0)
+        session.system_prompt = self.system_prompt
+        session.context = list(self.context)
+        return session
 
     def set_language(self, language):
-        if language == "tr":
-            self.system_prompt = "Sen yardımsever bir yapay zeka asistanısın. SADECE TÜRKÇE konuş. Cevapların öz ama bilgilendirici olsun (2-3 cümle)."
-        else:
-            self.system_prompt = "You are a helpful AI assistant. Speak ONLY ENGLISH. Keep answers concise but informative (2-3 sentences)."
+        self.system_prompt = system_prompt_for(language)
         print(f"LLM Language set to: {language}")
 
-    def chat(self, user_text):
+    def chat(self, user_text, session=None):
         """
         Sends text to Ollama and yields streamed response chunks.
+        If a ChatSession is given, its prompt and context are used and updated
+        instead of the engine's own state.
         """
         payload = {
             "model": self.model_name,
             "prompt": user_text,
-            "system": self.system_prompt,
+            "system": session.system_prompt if session else self.system_prompt,
             "stream": True,
-            "context": self.context # pass previous context
+            "context": session.context if session else self.context # pass previous context
         }
         
+        if session and session.aborted:
+            return
         try:
-            with requests.post(self.base_url, json=payload, stream=True) as response:
+            with self.session.post(self.base_url, json=payload, stream=True, timeout=self.timeout) as response:
                 response.raise_for_status()
+                if session:
+                    session.response = response
+                    if session.aborted: # abort() ran before the response was registered
+                        return
                 for line in response.iter_lines():
                     if line:
                         body = json.loads(line)
@@ -38,6 +234,19 @@ class LLMEngine:
                             yield body["response"]
                         if "done" in body and body["done"]:
                             if "context" in body:
-                                self.context = body["context"]
-        except requests.exceptions.ConnectionError:
-            yield "Error: Could not connect to Ollama. Is it running?"
+                                if session:
+                                    session.update_context(body["context"])
+                                else:
+                                    self.context = body["context"]
+        except Exception as e:
+            if session and session.aborted:
+                return # Stream closed on purpose by abort()
+            if isinstance(e, requests.exceptions.ConnectionError):
+                yield "Error: Could not connect to Ollama. Is it running?"
+            elif isinstance(e, requests.exceptions.Timeout):
+                yield "Error: Ollama did not respond in time."
+            else:
+                raise
+        finally:
+            if session:
+                session.response = None
@@ -0,0 +1,6 @@
+def percentile_ms(values, q):
+    """Nearest-rank q-quantile (0..1) of durations in seconds, in milliseconds. None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
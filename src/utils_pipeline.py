@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class StageRunner:
+    """
+    Runs blocking pipeline stages (STT, LLM, TTS, ...) off the event loop.
+    Each stage gets its own thread pool, so `limits[stage]` is also the max
+    number of concurrent calls for that stage and a slow stage cannot starve
+    the others.
+    """
+    def __init__(self, limits):
+        self.executors = {
+            stage: ThreadPoolExecutor(max_workers=max(1, n), thread_name_prefix=f"stage-{stage}")
+            for stage, n in limits.items()
+        }
+        self.limits = dict(limits)
+        self.active = {stage: 0 for stage in limits}
+        self.lock = threading.Lock()
+
+    def _tracked(self, stage, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                self.active[stage] += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.active[stage] -= 1
+        return wrapper
+
+    async def run(self, stage, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the stage's pool and awaits the result."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._tracked(stage, fn), *args, **kwargs)
+        return await loop.run_in_executor(self.executors[stage], call)
+
+    async def iterate(self, stage, fn, *args, **kwargs):
+        """
+        Async-iterates a blocking generator fn(*args, **kwargs) that runs on
+        the stage's pool. Items are handed over as soon as they are produced.
+        If the consumer stops early, the generator is closed on its thread.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stopped = threading.Event()
+        done = object()
+
+        def produce():
+            generator = fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+            finally:
+                generator.close()
+
+        future = loop.run_in_executor(self.executors[stage], self._tracked(stage, produce))
+        future.add_done_callback(lambda _future: items.put_nowait(done))
+        try:
+            while True:
+                item = await items.get()
+                if item is done:
+                    break
+                yield item
+            # Re-raise errors from the producer thread
+            await future
+        finally:
+            stopped.set()
+
+    def stats(self):
+        with self.lock:
+            return {stage: {"active": self.active[stage], "limit": self.limits[stage]} for stage in self.limits}
@@ -0,0 +1,208 @@
+import struct
+import threading
+import numpy as np
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    # Missing package or PortAudio library: callers fall back to aplay
+    sd = None
+
+class PCMRingBuffer:
+    """
+    Preallocated float32 ring buffer between one writer thread and the audio
+    callback. write() blocks while the buffer is full; read_into() never
+    blocks and pads with silence on underflow.
+    """
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.read_pos = 0
+        self.size = 0
+        self.generation = 0 # Bumped by clear() to abort blocked writers
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    @property
+    def available(self):
+        with self.lock:
+            return self.size
+
+    def write(self, samples, stop_event=None, generation=None):
+        """
+        Copies samples in, waiting for space. Returns False if stopped, or
+        cleared since `generation` (default: since the call), without writing
+        the rest. stop_event is checked under the lock, so a writer racing a
+        stop()-then-clear() can never queue audio after the clear.
+        """
+        offset = 0
+        with self.lock:
+            if generation is None:
+                generation = self.generation
+            while offset < len(samples):
+                while self.size == self.capacity:
+                    if generation != self.generation or (stop_event is not None and stop_event.is_set()):
+                        return False
+                    self.changed.wait(timeout=0.05)
+                if generation != self.generation or (stop_event is not None and stop_event.is_set()):
+                    return False
+                write_pos = (self.read_pos + self.size) % self.capacity
+                count = min(len(samples) - offset, self.capacity - self.size, self.capacity - write_pos)
+                self.data[write_pos:write_pos + count] = samples[offset:offset + count]
+                self.size += count
+                offset += count
+        return True
+
+    def read_into(self, out):
+        """Fills `out` with buffered samples, zero-padding what is missing."""
+        with self.lock:
+            count = min(len(out), self.size)
+            first = min(count, self.capacity - self.read_pos)
+            out[:first] = self.data[self.read_pos:self.read_pos + first]
+            out[first:count] = self.data[:count - first]
+            out[count:] = 0.0
+            self.read_pos = (self.read_pos + count) % self.capacity
+            self.size -= count
+            if count:
+                self.changed.notify_all()
+        return count
+
+    def clear(self):
+        with self.lock:
+            self.read_pos = 0
+            self.size = 0
+            self.generation += 1
+            self.changed.notify_all()
+
+    def wait_until_empty(self, stop_event=None):
+        with self.lock:
+            while self.size > 0:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self.changed.wait(timeout=0.05)
+        return True
+
+class StreamResampler:
+    """Linear-interpolation resampler that keeps state across chunks, so sentence audio joins without clicks."""
+    def __init__(self, in_rate, out_rate):
+        self.ratio = in_rate / out_rate
+        self.reset()
+
+    def reset(self):
+        self.pos = 0.0
+        self.prev = None
+
+    def process(self, samples):
+        if self.ratio == 1.0 or len(samples) == 0:
+            return samples
+        buf = samples if self.prev is None else np.concatenate(([self.prev], samples))
+        last = len(buf) - 1
+        if last < self.pos:
+            count = 0
+        else:
+            count = int(np.floor((last - self.pos) / self.ratio)) + 1
+        positions = self.pos + np.arange(count) * self.ratio
+        out = np.interp(positions, np.arange(len(buf)), buf).astype(np.float32)
+        # Next chunk's buffer starts at the current last sample
+        self.pos = self.pos + count * self.ratio - last
+        self.prev = buf[-1]
+        return out
+
+class WavStreamDecoder:
+    """Incrementally parses a (possibly open-ended) PCM16 WAV stream into float32 samples."""
+    def __init__(self):
+        self.pending = b""
+        self.in_data = False
+        self.sample_rate = None
+        self.channels = 1
+
+    def feed(self, chunk):
+        self.pending += chunk
+        if not self.in_data and not self._parse_header():
+            return np.zeros(0, dtype=np.float32)
+        usable = len(self.pending) - (len(self.pending) % (2 * self.channels))
+        pcm, self.pending = self.pending[:usable], self.pending[usable:]
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return samples
+
+    def _parse_header(self):
+        data = self.pending
+        if len(data) < 12:
+            return False
+        pos = 12 # Skip "RIFF" <size> "WAVE"
+        while pos + 8 <= len(data):
+            chunk_id, chunk_size = struct.unpack("<4sI", data[pos:pos + 8])
+            if chunk_id == b"data":
+                self.pending = data[pos + 8:]
+                self.in_data = True
+                return True
+            if pos + 8 + chunk_size > len(data):
+                return False
+            if chunk_id == b"fmt ":
+                _, self.channels, self.sample_rate = struct.unpack("<HHI", data[pos + 8:pos + 16])
+            pos += 8 + chunk_size + (chunk_size % 2)
+        return False
+
+class AudioPlayer:
+    """
+    In-process playback: one long-lived output stream fed from a PCMRingBuffer.
+    Consecutive sentences are appended to the same buffer (gapless), flush()
+    drops everything queued for instant barge-in, and input is resampled to
+    the device rate (XTTS produces 24 kHz).
+    """
+    def __init__(self, sample_rate=None, buffer_seconds=10.0, blocksize=512):
+        if sd is None:
+            raise RuntimeError("sounddevice is not available")
+        self.sample_rate = int(sample_rate or sd.query_devices(kind="output")["default_samplerate"])
+        self.ring = PCMRingBuffer(int(self.sample_rate * buffer_seconds))
+        self.resamplers = {}
+        self.generation = self.ring.generation # Ring generation the resampler state belongs to
+        self.stream = sd.OutputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype="float32",
+            blocksize=blocksize,
+            callback=self._callback
+        )
+        self.stream.start()
+        print(f"Audio player started ({self.sample_rate} Hz)")
+
+    @staticmethod
+    def available():
+        return sd is not None
+
+    def _callback(self, outdata, frames, time_info, status):
+        self.ring.read_into(outdata[:, 0])
+
+    def write(self, samples, sample_rate, stop_event=None):
+        """
+        Queues float32 mono samples for playback. Blocks while the buffer is
+        full; returns False once flushed or stop_event is set. Called from one
+        writer thread.
+        """
+        generation = self.ring.generation
+        if generation != self.generation:
+            # flush() ran since the last write; resampler state is only touched here
+            for resampler in self.resamplers.values():
+                resampler.reset()
+            self.generation = generation
+        if sample_rate != self.sample_rate:
+            resampler = self.resamplers.get(sample_rate)
+            if resampler is None:
+                resampler = self.resamplers[sample_rate] = StreamResampler(sample_rate, self.sample_rate)
+            samples = resampler.process(samples)
+        return self.ring.write(samples, stop_event, generation)
+
+    def flush(self):
+        """Drops all queued audio immediately. Safe to call from any thread."""
+        self.ring.clear()
+
+    def wait_until_played(self, stop_event=None):
+        return self.ring.wait_until_empty(stop_event)
+
+    def close(self):
+        self.flush()
+        self.stream.stop()
+        self.stream.close()
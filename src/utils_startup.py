@@ -0,0 +1,170 @@
+import subprocess
+import threading
+import asyncio
+import time
+import sys
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Comma-separated components loaded on first use instead of at startup (e.g. "stt")
+LAZY_COMPONENTS = {name.strip() for name in os.getenv("LAZY_COMPONENTS", "").split(",") if name.strip()}
+# Model load plus warmup synthesis can take minutes on CPU
+XTTS_STARTUP_TIMEOUT = float(os.getenv("XTTS_STARTUP_TIMEOUT", "300"))
+
+class Component:
+    """One startup component: its loader, readiness state and load time."""
+    def __init__(self, name, loader, lazy=False):
+        self.name = name
+        self.loader = loader
+        self.lazy = lazy
+        self.state = "pending" # pending -> loading -> ready | failed
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def load(self):
+        """Runs the loader once; concurrent callers wait for the first one."""
+        with self.lock:
+            if self.state != "pending":
+                owner = False
+            else:
+                self.state = "loading"
+                owner = True
+        if not owner:
+            self.done.wait()
+            return self._result()
+
+        started = time.monotonic()
+        print(f"[startup] Loading {self.name}...")
+        try:
+            self.value = self.loader()
+            self.state = "ready"
+            print(f"[startup] {self.name} ready in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            self.error = e
+            self.state = "failed"
+            print(f"[startup] {self.name} failed: {e}")
+        finally:
+            self.load_seconds = time.monotonic() - started
+            self.done.set()
+        return self._result()
+
+    def _result(self):
+        if self.state == "failed":
+            raise RuntimeError(f"{self.name} failed to load: {self.error}")
+        return self.value
+
+    def status(self):
+        status = {"state": self.state, "lazy": self.lazy}
+        if self.load_seconds is not None:
+            status["load_s"] = round(self.load_seconds, 2)
+        if self.error is not None:
+            status["error"] = str(self.error)
+        return status
+
+class LazyProxy:
+    """Stands in for a component's value; the first attribute access loads (or waits for) it."""
+    def __init__(self, component):
+        object.__setattr__(self, "_component", component)
+
+    def __getattr__(self, attr):
+        return getattr(self._component.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._component.load(), attr, value)
+
+class StartupOrchestrator:
+    """
+    Loads independent components (models, subprocesses) concurrently and
+    tracks per-component readiness. Components marked lazy, or listed in
+    LAZY_COMPONENTS, are only loaded on first get() / proxy access.
+    """
+    def __init__(self):
+        self.components = {}
+        self.executor = None
+        self.started_at = None
+
+    def add(self, name, loader, lazy=False):
+        self.components[name] = Component(name, loader, lazy=lazy or name in LAZY_COMPONENTS)
+        return self.components[name]
+
+    def start(self):
+        """Starts loading every eager component in the background."""
+        self.started_at = time.monotonic()
+        eager = [c for c in self.components.values() if not c.lazy]
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(eager)), thread_name_prefix="startup")
+        for component in eager:
+            self.executor.submit(component.load)
+        return self
+
+    def wait(self, names=None, timeout=None):
+        """Blocks until the named (default: all eager) components are loaded. Raises if one failed."""
+        names = names or [c.name for c in self.components.values() if not c.lazy]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names:
+            component = self.components[name]
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not component.done.wait(remaining):
+                raise TimeoutError(f"{name} not ready after {timeout}s")
+            component._result()
+        if self.started_at is not None:
+            print(f"[startup] Ready in {time.monotonic() - self.started_at:.1f}s")
+
+    def get(self, name):
+        """The component's value, loading it now if it is lazy."""
+        return self.components[name].load()
+
+    async def get_async(self, name):
+        """get() for async code: waits (or lazily loads) on a worker thread, not the event loop."""
+        component = self.components[name]
+        if component.state == "ready":
+            return component.value
+        return await asyncio.to_thread(component.load)
+
+    def is_ready(self, name):
+        return self.components[name].state == "ready"
+
+    def proxy(self, name):
+        return LazyProxy(self.components[name])
+
+    @property
+    def ready(self):
+        """True once every eager component has loaded."""
+        return all(c.state == "ready" for c in self.components.values() if not c.lazy)
+
+    def status(self):
+        return {name: component.status() for name, component in self.components.items()}
+
+def launch_xtts_server():
+    """Starts src/xtts_server.py, preferring the dedicated .venv_xtts interpreter if present."""
+    server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xtts_server.py")
+    xtts_venv_python = os.path.join(os.getcwd(), ".venv_xtts", "bin", "python")
+    python_exec = xtts_venv_python if os.path.exists(xtts_venv_python) else sys.executable
+    print(f"Starting XTTS Server with {python_exec}...")
+    return subprocess.Popen([python_exec, server_script], stdout=sys.stdout, stderr=sys.stderr)
+
+def wait_for_xtts(process, port=8002):
+    """Waits until the XTTS server has loaded its model and finished warming up (/ready)."""
+    return wait_for_http(f"http://127.0.0.1:{port}/ready", timeout=XTTS_STARTUP_TIMEOUT, process=process)
+
+def wait_for_http(url, timeout=180, interval=0.25, process=None):
+    """
+    Polls `url` until it answers 200. Fails early if `process` (the server
+    being waited on) exits. Raises TimeoutError / RuntimeError.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server process exited with code {process.returncode}")
+        try:
+            # Plain request: the shared session retries connects, which would slow polling
+            response = requests.get(url, timeout=(1, 2))
+            if response.status_code == 200:
+                return response.json()
+        except Exception:
+            pass
+        time.sleep(interval)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
@@ -1,21 +1,96 @@
 from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio, pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_suppressed_tokens
+from faster_whisper.vad import get_speech_timestamps, VadOptions
+import numpy as np
+import threading
+import string
+import io
 import os
 
+SAMPLE_RATE = 16000
+MAX_BATCH_SECONDS = 30 # Whisper's window; longer audio needs the sequential decoder
+VAD_OPTIONS = VadOptions(min_silence_duration_ms=500) # Same settings as the vad_filter pass
+
+def decode_audio_bytes(data, audio_format="webm"):
+    """
+    Decodes an uploaded recording fully in memory into a 16 kHz mono float32 array.
+    audio_format: "pcm16" for raw 16 kHz int16 little-endian samples,
+                  "f32" for raw 16 kHz float32 samples,
+                  anything else (webm, ogg, wav, ...) is decoded with PyAV.
+    """
+    if audio_format in ("pcm16", "pcm_s16le"):
+        usable = len(data) - (len(data) % 2)
+        return np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+    if audio_format in ("f32", "pcm_f32le"):
+        usable = len(data) - (len(data) % 4)
+        return np.frombuffer(data[:usable], dtype=np.float32).copy()
+    return decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+
+def find_speech(audio):
+    """Silero speech regions of a 16 kHz float32 array as [{"start", "end"}] in samples."""
+    return get_speech_timestamps(audio, VAD_OPTIONS)
+
+def crop_to_speech(audio, speech_timestamps, gap_s=0.1):
+    """Keeps only the given speech regions ({"start", "end"} in samples), joined by short silences."""
+    if not speech_timestamps:
+        return audio[:0]
+    gap = np.zeros(int(gap_s * SAMPLE_RATE), dtype=audio.dtype)
+    parts = []
+    for region in speech_timestamps:
+        if parts:
+            parts.append(gap)
+        parts.append(audio[max(0, region["start"]):region["end"]])
+    return np.concatenate(parts)
+
+def prepare_speech(audio_data, speech_timestamps=None, presegmented=False):
+    """
+    Returns (audio, vad_filter) for faster-whisper. Audio that was already
+    segmented, or comes with speech timestamps, skips the vad_filter pass;
+    timestamps are used to crop it down to the speech.
+    """
+    if speech_timestamps is not None:
+        return crop_to_speech(audio_data, speech_timestamps), False
+    return audio_data, not presegmented
+
 class STTEngine:
-    def __init__(self, model_size="large-v3", device="cuda", compute_type="int8"):
+    def __init__(self, model_size="large-v3", device="cuda", compute_type="int8", num_workers=1, cpu_threads=0):
+        """
+        num_workers: model replicas, i.e. how many threads can transcribe concurrently.
+        cpu_threads: threads per replica on CPU (0 = CTranslate2 default).
+        """
+        self.name = model_size
         try:
              print(f"Loading Whisper model ({model_size}) on {device}...")
-             self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
+             self.model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                                       num_workers=num_workers, cpu_threads=cpu_threads)
         except Exception as e:
              print(f"Failed to load on {device} ({e}), falling back to CPU...")
-             self.model = WhisperModel(model_size, device="cpu", compute_type="int8")
+             self.model = WhisperModel(model_size, device="cpu", compute_type="int8",
+                                       num_workers=num_workers, cpu_threads=cpu_threads)
         print("Whisper model loaded.")
 
-    def transcribe(self, audio_data, language=None):
+    def transcribe(self, audio_data, language=None, speech_timestamps=None, presegmented=False):
         """
         Transcribes audio data using faster-whisper.
-        audio_data: Valid input for faster-whisper (file path or binary-like object)
+        audio_data: Valid input for faster-whisper (file path, binary-like object
+                    or 16 kHz float32 numpy array, see decode_audio_bytes)
+        speech_timestamps: Silero regions ([{"start", "end"}] in samples) of a numpy
+                    array; the audio is cropped to them and not run through VAD again
+        presegmented: the caller already trimmed the audio to speech, skip the VAD pass
+        """
+        text, lang, _, _ = self.transcribe_scored(audio_data, language, speech_timestamps=speech_timestamps, presegmented=presegmented)
+        return text, lang
+
+    def transcribe_scored(self, audio_data, language=None, beam_size=5, speech_timestamps=None, presegmented=False):
+        """
+        Like transcribe(), plus confidence: returns (text, language, lowest segment
+        avg_logprob, highest segment no_speech_prob). Scores are None without segments.
         """
+        audio_data, vad_filter = prepare_speech(audio_data, speech_timestamps, presegmented)
+        if isinstance(audio_data, np.ndarray) and len(audio_data) == 0:
+            return "", language, None, None
         # faster-whisper expects a file path or a file-like object. 
         # If passing raw bytes/buffer, ensure it's wrapped or saved.
         # Here we assume audio_data is a file path or BytesIO for simplicity in this wrapper
@@ -23,15 +98,360 @@ class STTEngine:
         
         segments, info = self.model.transcribe(
             audio_data, 
-            beam_size=5, 
+            beam_size=beam_size, 
             language=language,
             task="transcribe",
-            vad_filter=True,
+            vad_filter=vad_filter,
             vad_parameters=dict(min_silence_duration_ms=500)
         )
         
         text = ""
+        avg_logprob = None
+        no_speech_prob = None
         for segment in segments:
             text += segment.text + " "
+            avg_logprob = segment.avg_logprob if avg_logprob is None else min(avg_logprob, segment.avg_logprob)
+            no_speech_prob = segment.no_speech_prob if no_speech_prob is None else max(no_speech_prob, segment.no_speech_prob)
             
-        return text.strip(), info.language
+        return text.strip(), info.language, avg_logprob, no_speech_prob
+
+    def transcribe_with_tier(self, audio_data, language=None, speech_timestamps=None, presegmented=False):
+        """Returns (text, language, name of the model that produced it)."""
+        text, lang = self.transcribe(audio_data, language, speech_timestamps, presegmented)
+        return text, lang, self.name
+
+    def transcribe_batch_with_tier(self, audios, language):
+        return [(text, self.name) for text in self.transcribe_batch(audios, language)]
+
+    def transcribe_words(self, audio_data, language=None, beam_size=5, initial_prompt=None, vad_filter=True):
+        """
+        Transcribes with word timestamps.
+        vad_filter: False skips faster-whisper's VAD pass for audio already trimmed to speech
+        Returns ([(start, end, word), ...], detected_language).
+        """
+        segments, info = self.model.transcribe(
+            audio_data,
+            beam_size=beam_size,
+            language=language,
+            task="transcribe",
+            initial_prompt=initial_prompt,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            vad_filter=vad_filter,
+            vad_parameters=dict(min_silence_duration_ms=500)
+        )
+        words = []
+        for segment in segments:
+            for word in segment.words or []:
+                words.append((word.start, word.end, word.word))
+        return words, info.language
+
+    def transcribe_batch(self, audios, language, beam_size=5, no_speech_threshold=0.6, log_prob_threshold=-1.0):
+        """
+        Transcribes several utterances of the same language with one encoder
+        and one decoder call, like faster-whisper's BatchedInferencePipeline
+        but across separate requests. Each audio must be a 16 kHz float32
+        array of at most MAX_BATCH_SECONDS, already cropped to speech (see
+        crop_to_speech); empty arrays give "". There is no VAD filter or
+        temperature fallback, so remaining silence is dropped with Whisper's
+        usual no-speech rule instead. Returns one text per audio.
+        """
+        results = self.transcribe_batch_scored(audios, language, beam_size, no_speech_threshold, log_prob_threshold)
+        return [text for text, _, _ in results]
+
+    def transcribe_batch_scored(self, audios, language, beam_size=5, no_speech_threshold=0.6, log_prob_threshold=-1.0):
+        """transcribe_batch() returning (text, avg_logprob, no_speech_prob) per audio."""
+        scored = [("", None, None)] * len(audios)
+        indices = [i for i, audio in enumerate(audios) if len(audio)]
+        if not indices:
+            return scored
+        audios = [audios[i] for i in indices]
+        model = self.model
+        features = np.stack([pad_or_trim(model.feature_extractor(audio)[..., :-1]) for audio in audios])
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+        prompt = model.get_prompt(tokenizer, [], without_timestamps=True)
+        encoder_output = model.encode(features)
+        results = model.model.generate(
+            encoder_output,
+            [list(prompt) for _ in audios],
+            beam_size=beam_size,
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=list(get_suppressed_tokens(tokenizer, [-1])),
+            return_scores=True,
+            return_no_speech_prob=True,
+        )
+        for i, result in zip(indices, results):
+            tokens = result.sequences_ids[0]
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            if result.no_speech_prob > no_speech_threshold and avg_logprob < log_prob_threshold:
+                text = ""
+            else:
+                text = tokenizer.decode(tokens).strip()
+            scored[i] = (text, avg_logprob, result.no_speech_prob)
+        return scored
+
+class TieredSTTEngine:
+    """
+    Two Whisper models behind the STTEngine interface. Audio up to
+    `fast_max_seconds` is decoded first by the small model with greedy
+    search. The result is kept unless its confidence is low (a segment
+    avg_logprob below `min_avg_logprob`, or text with no_speech_prob above
+    `max_no_speech_prob`); then the accurate model decodes it again.
+    transcribe_with_tier() reports which model served the request.
+    """
+    def __init__(self, fast, accurate, min_avg_logprob=-0.6, max_no_speech_prob=0.6, fast_max_seconds=15.0):
+        self.fast = fast
+        self.accurate = accurate
+        self.min_avg_logprob = min_avg_logprob
+        self.max_no_speech_prob = max_no_speech_prob
+        self.fast_max_samples = int(fast_max_seconds * SAMPLE_RATE)
+
+    def _confident(self, text, avg_logprob, no_speech_prob):
+        if not text:
+            return no_speech_prob is None or no_speech_prob >= self.max_no_speech_prob
+        return avg_logprob >= self.min_avg_logprob and no_speech_prob <= self.max_no_speech_prob
+
+    def _use_fast(self, audio_data):
+        return not isinstance(audio_data, np.ndarray) or len(audio_data) <= self.fast_max_samples
+
+    def transcribe_with_tier(self, audio_data, language=None, speech_timestamps=None, presegmented=False):
+        if isinstance(audio_data, np.ndarray) and not presegmented:
+            # Segment once here instead of once per tier
+            audio_data = crop_to_speech(audio_data, speech_timestamps if speech_timestamps is not None else find_speech(audio_data))
+            presegmented = True
+            if len(audio_data) == 0:
+                return "", language, self.fast.name
+        if self._use_fast(audio_data):
+            text, lang, avg_logprob, no_speech_prob = self.fast.transcribe_scored(audio_data, language, beam_size=1, presegmented=presegmented)
+            if self._confident(text, avg_logprob, no_speech_prob):
+                return text, lang, self.fast.name
+        text, lang = self.accurate.transcribe(audio_data, language, presegmented=presegmented)
+        return text, lang, self.accurate.name
+
+    def transcribe(self, audio_data, language=None, speech_timestamps=None, presegmented=False):
+        text, lang, _ = self.transcribe_with_tier(audio_data, language, speech_timestamps, presegmented)
+        return text, lang
+
+    def transcribe_batch_with_tier(self, audios, language):
+        results = [None] * len(audios)
+        fast_indices = [i for i, audio in enumerate(audios) if self._use_fast(audio)]
+        if fast_indices:
+            scored = self.fast.transcribe_batch_scored([audios[i] for i in fast_indices], language, beam_size=1)
+            for i, (text, avg_logprob, no_speech_prob) in zip(fast_indices, scored):
+                # The batched path already blanks silence, so an empty result is confident
+                if not text or self._confident(text, avg_logprob, no_speech_prob):
+                    results[i] = (text, self.fast.name)
+        retry = [i for i, result in enumerate(results) if result is None]
+        if retry:
+            texts = self.accurate.transcribe_batch([audios[i] for i in retry], language)
+            for i, text in zip(retry, texts):
+                results[i] = (text, self.accurate.name)
+        return results
+
+    def transcribe_batch(self, audios, language):
+        return [text for text, _ in self.transcribe_batch_with_tier(audios, language)]
+
+    def transcribe_words(self, audio_data, language=None, beam_size=5, initial_prompt=None, vad_filter=True):
+        # Streaming partials commit words, so they keep using the accurate model
+        return self.accurate.transcribe_words(audio_data, language, beam_size, initial_prompt, vad_filter)
+
+def create_stt_engine(device="cuda", compute_type="int8", num_workers=1, cpu_threads=0):
+    """
+    STTEngine for STT_MODEL (default large-v3). Setting STT_FAST_MODEL (e.g.
+    "small" or "distil-large-v3") adds a fast first tier, see TieredSTTEngine.
+    """
+    accurate = STTEngine(os.getenv("STT_MODEL", "large-v3"), device, compute_type, num_workers, cpu_threads)
+    fast_model = os.getenv("STT_FAST_MODEL")
+    if not fast_model:
+        return accurate
+    fast = STTEngine(fast_model, device, compute_type, num_workers, cpu_threads)
+    return TieredSTTEngine(
+        fast,
+        accurate,
+        min_avg_logprob=float(os.getenv("STT_ESCALATE_LOGPROB", "-0.6")),
+        max_no_speech_prob=float(os.getenv("STT_ESCALATE_NO_SPEECH", "0.6")),
+        fast_max_seconds=float(os.getenv("STT_FAST_MAX_SECONDS", "15"))
+    )
+
+def _normalize_word(word):
+    return word.strip().lower().strip(string.punctuation)
+
+class StreamingTranscriber:
+    """
+    Transcribes one utterance incrementally while the user is still speaking.
+
+    Every `step_ms` of new audio a background thread re-decodes the
+    uncommitted window. Words that two consecutive hypotheses agree on
+    (local agreement) are committed and the audio before the last committed
+    word is dropped, so finish() only has to decode the uncommitted tail.
+
+    Chunks are fed with the caller's VAD decision. Partial decodes keep
+    Whisper's vad_filter, since their windows can end in silence. peek() and
+    finish() cut the window `trailing_pad_ms` after the last speech chunk and
+    decode it without the VAD pass.
+    """
+    def __init__(self, stt_engine, language=None, step_ms=1000, partial_beam_size=1, max_window_s=20.0, trailing_pad_ms=200):
+        self.stt = stt_engine
+        self.language = language
+        self.step_samples = int(SAMPLE_RATE * step_ms / 1000)
+        self.partial_beam_size = partial_beam_size
+        self.max_window_samples = int(SAMPLE_RATE * max_window_s)
+        self.trailing_pad_s = trailing_pad_ms / 1000
+
+        self.chunks = []            # Uncommitted audio window
+        self.window_samples = 0
+        self.window_offset = 0.0    # Start of the window within the utterance (seconds)
+        self.new_samples = 0        # Audio fed since the last partial decode
+        self.committed = []         # [(start, end, word)] in utterance time
+        self.hypothesis = []        # Uncommitted words of the latest partial decode
+        self.detected_language = language
+        self.decoded_until = 0.0    # Utterance time covered by the latest partial decode
+        self.speech_until = 0.0     # Utterance time where the last speech chunk ends
+        self.force_decode = False
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def feed(self, chunk, is_speech=True):
+        """Adds a chunk; is_speech is the caller's VAD decision for it."""
+        with self.lock:
+            if self.closed:
+                return
+            self.chunks.append(chunk)
+            self.window_samples += len(chunk)
+            self.new_samples += len(chunk)
+            if is_speech:
+                self.speech_until = self.window_offset + self.window_samples / SAMPLE_RATE
+            if self.new_samples >= self.step_samples:
+                self.wakeup.notify()
+
+    def request_partial(self):
+        """Asks for a partial decode now (e.g. when the user pauses) instead of waiting for the next step."""
+        with self.lock:
+            self.force_decode = True
+            self.wakeup.notify()
+
+    @property
+    def total_seconds(self):
+        """Length of the audio fed so far."""
+        with self.lock:
+            return self.window_offset + self.window_samples / SAMPLE_RATE
+
+    @property
+    def committed_text(self):
+        with self.lock:
+            return "".join(word for _, _, word in self.committed).strip()
+
+    @property
+    def partial_text(self):
+        """Committed words plus the latest (unstable) hypothesis."""
+        with self.lock:
+            return "".join(word for _, _, word in self.committed + self.hypothesis).strip()
+
+    def _snapshot(self):
+        audio = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.float32)
+        prompt = "".join(word for _, _, word in self.committed).strip() or None
+        return audio, self.window_offset, prompt
+
+    def _speech_tail(self):
+        """The uncommitted window up to trailing_pad after the last speech, and the committed prompt."""
+        audio, offset, prompt = self._snapshot()
+        end = int((self.speech_until + self.trailing_pad_s - offset) * SAMPLE_RATE)
+        return audio[:max(0, end)], prompt
+
+    def _decode_tail(self, audio, prompt):
+        """Final-style decode of a speech tail: already trimmed by the caller's VAD, so no vad_filter."""
+        return self.stt.transcribe_words(audio, language=self.language, initial_prompt=prompt, vad_filter=False)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.closed and self.new_samples < self.step_samples and not self.force_decode:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                self.new_samples = 0
+                self.force_decode = False
+                audio, offset, prompt = self._snapshot()
+            try:
+                words, lang = self.stt.transcribe_words(
+                    audio, language=self.language, beam_size=self.partial_beam_size, initial_prompt=prompt
+                )
+            except Exception as e:
+                print(f"Streaming STT error: {e}")
+                continue
+            with self.lock:
+                # Results for a window that moved in the meantime are stale
+                if self.closed or offset != self.window_offset:
+                    continue
+                self.detected_language = lang
+                self.decoded_until = offset + len(audio) / SAMPLE_RATE
+                self._update([(start + offset, end + offset, word) for start, end, word in words])
+
+    def _update(self, words):
+        # Local agreement: commit the common prefix of the last two hypotheses
+        agreed = 0
+        for previous, current in zip(self.hypothesis, words):
+            if _normalize_word(previous[2]) != _normalize_word(current[2]):
+                break
+            agreed += 1
+        # Guard against an unbounded window if hypotheses keep disagreeing
+        if agreed == 0 and self.window_samples > self.max_window_samples and len(words) > 2:
+            agreed = len(words) - 2
+
+        if agreed:
+            self.committed.extend(words[:agreed])
+            self._trim_window(words[agreed - 1][1])
+        self.hypothesis = words[agreed:]
+
+    def _trim_window(self, until):
+        """Drops window audio before `until` (utterance time, seconds)."""
+        drop = int((until - self.window_offset) * SAMPLE_RATE)
+        if drop <= 0:
+            return
+        audio = np.concatenate(self.chunks)[drop:]
+        self.chunks = [audio] if len(audio) else []
+        self.window_samples = len(audio)
+        self.window_offset += drop / SAMPLE_RATE
+
+    def peek(self):
+        """
+        Transcript of everything fed so far, without ending the stream.
+        Returns (text, language); used for speculative turns.
+        """
+        with self.lock:
+            audio, prompt = self._speech_tail()
+            committed = list(self.committed)
+        tail = []
+        lang = self.detected_language
+        if len(audio) > SAMPLE_RATE // 10:
+            tail, lang = self._decode_tail(audio, prompt)
+        return "".join(word for _, _, word in committed + tail).strip(), lang
+
+    def close(self):
+        """Stops partial decoding without a final pass."""
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+
+    def finish(self):
+        """
+        Stops partial decoding and transcribes the uncommitted tail.
+        Returns (text, language) like STTEngine.transcribe.
+        """
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+        self.worker.join()
+
+        audio, prompt = self._speech_tail()
+        tail = []
+        if len(audio) > SAMPLE_RATE // 10:
+            tail, lang = self._decode_tail(audio, prompt)
+            self.detected_language = lang
+        text = "".join(word for _, _, word in self.committed + tail).strip()
+        return text, self.detected_language
@@ -0,0 +1,189 @@
+import collections
+import threading
+import time
+import os
+from concurrent.futures import Future
+
+try:
+    from utils_stt import create_stt_engine, find_speech, crop_to_speech, SAMPLE_RATE, MAX_BATCH_SECONDS
+    from utils_metrics import percentile_ms
+except ImportError:
+    from src.utils_stt import create_stt_engine, find_speech, crop_to_speech, SAMPLE_RATE, MAX_BATCH_SECONDS
+    from src.utils_metrics import percentile_ms
+
+TranscriptionResult = collections.namedtuple(
+    "TranscriptionResult", ["text", "language", "queue_wait_s", "decode_s", "batch_size", "tier"]
+)
+TranscriptionResult.__doc__ = (
+    "Transcript plus how long the request waited for a worker, how long decoding took "
+    "and which model (tier) produced it."
+)
+
+def default_cpu_threads(num_workers):
+    """Splits the machine's cores evenly between the model replicas."""
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+class _Job:
+    __slots__ = ("audio", "language", "presegmented", "future", "submitted")
+
+    def __init__(self, audio, language, presegmented):
+        self.audio = audio
+        self.language = language
+        self.presegmented = presegmented
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+    @property
+    def batchable(self):
+        return self.language is not None and len(self.audio) <= MAX_BATCH_SECONDS * SAMPLE_RATE
+
+    def speech(self):
+        """The audio cropped to speech: the VAD pass the single-request path leaves to vad_filter."""
+        if self.presegmented:
+            return self.audio
+        return crop_to_speech(self.audio, find_speech(self.audio))
+
+class STTService:
+    """
+    Queue in front of an STTEngine (or TieredSTTEngine) for concurrent requests.
+
+    `num_workers` threads (one per model replica) take requests off a shared
+    queue. A worker that finds several short utterances in the same language
+    waiting decodes up to `max_batch_size` of them in one batched pass
+    (STTEngine.transcribe_batch); a lone request uses the regular
+    transcribe() path. Batched requests that are not `presegmented` are
+    cropped to speech first, so both paths see the same audio. Results
+    report queue wait and decode time separately.
+    """
+    def __init__(self, engine, num_workers=1, max_batch_size=8, max_wait_ms=10):
+        self.engine = engine
+        self.num_workers = max(1, num_workers)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.queue_waits = collections.deque(maxlen=200)
+        self.decode_times = collections.deque(maxlen=200)
+        self.tiers = collections.Counter()
+        self.workers = [
+            threading.Thread(target=self._worker, name=f"stt-worker-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    @classmethod
+    def from_env(cls, device="cuda", compute_type="float16"):
+        """Builds the engine(s) and service from STT_* environment variables."""
+        num_workers = int(os.getenv("STT_WORKERS", "1"))
+        cpu_threads = int(os.getenv("STT_CPU_THREADS", "0")) or default_cpu_threads(num_workers)
+        engine = create_stt_engine(
+            device=device,
+            compute_type=compute_type,
+            num_workers=num_workers,
+            cpu_threads=cpu_threads
+        )
+        return cls(
+            engine,
+            num_workers=num_workers,
+            max_batch_size=int(os.getenv("STT_MAX_BATCH_SIZE", "8")),
+            max_wait_ms=float(os.getenv("STT_BATCH_WAIT_MS", "10"))
+        )
+
+    def submit(self, audio, language=None, presegmented=False):
+        """
+        Queues a 16 kHz float32 array. Returns a concurrent.futures.Future of a TranscriptionResult.
+        presegmented: the audio is already cropped to speech, so the VAD pass is skipped.
+        """
+        job = _Job(audio, language, presegmented)
+        with self.lock:
+            self.pending.append(job)
+            # Wake everyone: a worker gathering a batch may not be able to take this job
+            self.available.notify_all()
+        return job.future
+
+    def transcribe(self, audio, language=None, presegmented=False):
+        """Blocking submit(); returns a TranscriptionResult."""
+        return self.submit(audio, language, presegmented).result()
+
+    def _take_batch(self):
+        """Waits for a job, then gathers compatible jobs queued within max_wait."""
+        with self.lock:
+            while not self.pending:
+                self.available.wait()
+            first = self.pending.popleft()
+            batch = [first]
+            if not first.batchable or self.max_batch_size == 1:
+                return batch
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                for job in list(self.pending):
+                    if len(batch) == self.max_batch_size:
+                        break
+                    if job.batchable and job.language == first.language:
+                        self.pending.remove(job)
+                        batch.append(job)
+                remaining = deadline - time.monotonic()
+                if len(batch) == self.max_batch_size or remaining <= 0:
+                    break
+                self.available.wait(remaining)
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            started = time.monotonic()
+            with self.lock:
+                self.busy += 1
+            try:
+                if len(batch) == 1:
+                    job = batch[0]
+                    outputs = [self.engine.transcribe_with_tier(job.audio, language=job.language, presegmented=job.presegmented)]
+                else:
+                    language = batch[0].language
+                    results = self.engine.transcribe_batch_with_tier([job.speech() for job in batch], language)
+                    outputs = [(text, language, tier) for text, tier in results]
+            except Exception as e:
+                with self.lock:
+                    self.busy -= 1
+                    self.failed += len(batch)
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+
+            decode_s = time.monotonic() - started
+            with self.lock:
+                self.busy -= 1
+                self.completed += len(batch)
+                self.decode_times.append(decode_s)
+                if len(batch) > 1:
+                    self.batches += 1
+                    self.batched_requests += len(batch)
+                for job in batch:
+                    self.queue_waits.append(started - job.submitted)
+                self.tiers.update(tier for _, _, tier in outputs)
+            for job, (text, language, tier) in zip(batch, outputs):
+                job.future.set_result(TranscriptionResult(text, language, started - job.submitted, decode_s, len(batch), tier))
+
+    def stats(self):
+        with self.lock:
+            waits = list(self.queue_waits)
+            decodes = list(self.decode_times)
+            return {
+                "workers": self.num_workers,
+                "busy": self.busy,
+                "queued": len(self.pending),
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "batched_requests": self.batched_requests,
+                "tiers": dict(self.tiers),
+                "queue_wait_ms": {"p50": percentile_ms(waits, 0.5), "p95": percentile_ms(waits, 0.95)},
+                "decode_ms": {"p50": percentile_ms(decodes, 0.5), "p95": percentile_ms(decodes, 0.95)},
+            }
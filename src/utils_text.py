@@ -0,0 +1,150 @@
+import re
+
+# Words that end with a period without ending the sentence (compared lowercase, without the dot)
+ABBREVIATIONS = {
+    "en": {
+        "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "inc", "ltd",
+        "co", "corp", "no", "approx", "dept", "est", "fig", "vol", "min", "max", "mt", "ft", "u.s",
+        "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    },
+    "tr": {
+        "dr", "prof", "doç", "yrd", "av", "sn", "vb", "vs", "örn", "bkz", "yy", "mah", "cad", "sok",
+        "apt", "no", "tel", "sf", "s", "öğr", "gör", "müh", "yön", "bşk", "alb", "org", "ltd", "şti",
+    },
+}
+
+SENTENCE_END = ".!?…\n"
+CLOSERS = "\"')]}»”’"
+CLAUSE_RE = re.compile(r"[,;:—–](?=\s)")
+
+class TextChunker:
+    """
+    Splits streamed LLM text into chunks for TTS.
+
+    Sentence boundaries are found in the accumulated text rather than per
+    token, so tokens like " it." work, and abbreviations ("Dr.", "örn."),
+    decimals ("3.14"), initials and Turkish ordinals ("1. sırada") do not
+    split. The first chunk is emitted as early as possible (at the first
+    sentence end, or at a clause boundary once it gets long) to keep time to
+    first audio low. Later sentences are merged up to `target_chars` so each
+    XTTS call carries more text, and no chunk exceeds `max_chars`.
+    """
+    def __init__(self, lang="en", first_min_chars=12, first_clause_chars=60, target_chars=150, max_chars=250):
+        self.abbreviations = ABBREVIATIONS.get(lang, set()) | ABBREVIATIONS["en"]
+        self.first_min_chars = first_min_chars
+        self.first_clause_chars = first_clause_chars
+        self.target_chars = target_chars
+        self.max_chars = max(max_chars, target_chars)
+        self.buffer = ""
+        self.emitted_first = False
+
+    def feed(self, text):
+        """Adds streamed text and returns the chunks that are ready (possibly none)."""
+        self.buffer += text
+        chunks = []
+        while True:
+            cut = self._next_cut()
+            if cut is None:
+                break
+            self._emit(cut, chunks)
+        return chunks
+
+    def flush(self):
+        """Returns whatever is left, split so that no chunk exceeds max_chars."""
+        chunks = []
+        while len(self.buffer.strip()) > self.max_chars:
+            self._emit(self._forced_cut(), chunks)
+        self._emit(len(self.buffer), chunks)
+        return chunks
+
+    def _emit(self, cut, chunks):
+        chunk = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut:]
+        if chunk:
+            chunks.append(chunk)
+            self.emitted_first = True
+
+    def _next_cut(self):
+        boundaries = self._boundaries()
+        length = len(self.buffer)
+
+        if not self.emitted_first:
+            for end in boundaries:
+                if len(self.buffer[:end].strip()) >= self.first_min_chars:
+                    return end
+            # A long first sentence: break at a clause so audio can start
+            if length >= self.first_clause_chars:
+                clause = self._last_clause(min(length, self.max_chars))
+                if clause and len(self.buffer[:clause].strip()) >= self.first_min_chars:
+                    return clause
+        else:
+            fitting = [end for end in boundaries if end <= self.target_chars]
+            # More text is already waiting, so merging further would pass the target
+            if fitting and length > self.target_chars:
+                return fitting[-1]
+            within_max = [end for end in boundaries if end <= self.max_chars]
+            if within_max and not fitting and length > self.target_chars:
+                return within_max[0]
+
+        if length > self.max_chars:
+            return self._forced_cut()
+        return None
+
+    def _boundaries(self):
+        """End offsets (after punctuation and closing quotes) of complete sentences in the buffer."""
+        text = self.buffer
+        ends = []
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char in SENTENCE_END:
+                end = i + 1
+                while end < len(text) and (text[end] in CLOSERS or text[end] in ".!?…"):
+                    end += 1
+                if char == "\n":
+                    ends.append(end)
+                elif end < len(text) and text[end].isspace():
+                    next_char = self._next_visible(end)
+                    if next_char is None and char == ".":
+                        break # Need the next word to rule out abbreviations / ordinals
+                    if char != "." or self._is_period_boundary(i, next_char):
+                        ends.append(end)
+                i = end
+            else:
+                i += 1
+        return ends
+
+    def _next_visible(self, start):
+        for char in self.buffer[start:]:
+            if not char.isspace():
+                return char
+        return None
+
+    def _is_period_boundary(self, index, next_char):
+        before = self.buffer[:index]
+        word = before.split()[-1].lower() if before.split() else ""
+        word = word.lstrip("\"'([{«“‘")
+        if word in self.abbreviations:
+            return False
+        # Initials like "J. Smith"
+        if len(word) == 1 and word.isalpha():
+            return False
+        # Ordinals ("1. sırada") and abbreviations we don't know continue in lowercase
+        if next_char is not None and next_char.islower():
+            return False
+        return True
+
+    def _last_clause(self, limit):
+        matches = [m.end() for m in CLAUSE_RE.finditer(self.buffer[:limit])]
+        return matches[-1] if matches else None
+
+    def _forced_cut(self):
+        """Cut point for text with no usable sentence end within max_chars."""
+        boundaries = [end for end in self._boundaries() if end <= self.max_chars]
+        if boundaries:
+            return boundaries[-1]
+        clause = self._last_clause(self.max_chars)
+        if clause:
+            return clause
+        space = self.buffer.rfind(" ", 0, self.max_chars)
+        return space if space > 0 else self.max_chars
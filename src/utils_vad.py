@@ -1,13 +1,50 @@
-import torch
+import threading
+import uuid
+import os
 import numpy as np
 
-class VADDetector:
-    def __init__(self, threshold=0.5):
-        self.threshold = threshold
-        print("Loading Silero VAD model...")
-        # Load Silero VAD from torch hub
+CHUNK_SIZE = 512 # Samples per Silero frame at 16 kHz
+CONTEXT_SIZE = 64 # Tail of the previous frame Silero prepends to each frame
+VAD_BACKEND = os.getenv("VAD_BACKEND", "torch") # "torch" (JIT via torch.hub) or "onnx"
+# Pinned hub release: the torch backend drives the JIT model's internal 16 kHz core
+VAD_HUB_REPO = os.getenv("VAD_HUB_REPO", "snakers4/silero-vad:v5.1.2")
+VAD_ONNX_MODEL = os.getenv("VAD_ONNX_MODEL", "models/silero_vad/silero_vad.onnx")
+# ONNX session threads: a single-frame RNN gains nothing from a thread pool; 0 keeps the library default
+VAD_INTRA_OP_THREADS = int(os.getenv("VAD_INTRA_OP_THREADS", "1"))
+VAD_INTER_OP_THREADS = int(os.getenv("VAD_INTER_OP_THREADS", "1"))
+# torch.set_num_threads() is process-wide (it would also throttle anything else
+# using torch in the bot), so the torch backend only changes it when this is set
+VAD_TORCH_THREADS = int(os.getenv("VAD_TORCH_THREADS", "0"))
+
+class VADState:
+    """
+    Recurrent state and frame context of one audio stream. Fixed size and
+    updated in place; `lock` serializes calls that advance the same stream.
+    """
+    def __init__(self, zeros):
+        self.state = zeros((2, 1, 128))
+        self.context = zeros((1, CONTEXT_SIZE))
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.state[...] = 0
+            self.context[...] = 0
+
+class TorchSileroBackend:
+    """
+    Silero JIT model from torch.hub; runs on CUDA when available.
+    `threads` (0 = leave as is) sets torch's intra-op thread count for the whole process.
+    """
+    name = "torch"
+
+    def __init__(self, threads=0, repo=VAD_HUB_REPO):
+        import torch
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
         self.model, _ = torch.hub.load(
-            repo_or_dir='snakers4/silero-vad',
+            repo_or_dir=repo,
             model='silero_vad',
             force_reload=False,
             onnx=False, # Use JIT for GPU support
@@ -16,26 +53,250 @@ class VADDetector:
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.model.to(self.device)
         self.model.reset_states()
+        # Stateless 16 kHz core: (context + frame, state) -> (prob, state).
+        # Private to the JIT wrapper; other releases may not have it.
+        self.core = getattr(self.model, "_model", None)
+        if self.core is None:
+            print(f"Silero VAD from {repo} has no stateless core; streams share the wrapper's state")
+
+    def zeros(self, shape):
+        return self.torch.zeros(*shape, device=self.device)
+
+    def concat(self, parts, axis):
+        return self.torch.cat(parts, dim=axis)
+
+    def to_frames(self, audio):
+        if isinstance(audio, np.ndarray):
+            audio = self.torch.from_numpy(audio)
+        audio = audio.to(self.device, dtype=self.torch.float32)
+        if audio.dim() == 1:
+            remainder = audio.shape[0] % CHUNK_SIZE
+            if remainder:
+                audio = self.torch.nn.functional.pad(audio, (0, CHUNK_SIZE - remainder))
+            audio = audio.reshape(-1, CHUNK_SIZE)
+        return audio
+
+    def _step(self, frames, state, context):
+        x = self.torch.cat([context, frames], dim=1)
+        if self.core is None:
+            # The wrapper keeps its own context and state, so pass the bare frame
+            out = self.model(frames, 16000)
+            return out.reshape(-1), state, x[:, -CONTEXT_SIZE:]
+        out, state = self.core(x, state)
+        return out.reshape(-1), state, x[:, -CONTEXT_SIZE:]
+
+    def step(self, frames, state, context):
+        with self.torch.no_grad():
+            probs, state, context = self._step(frames, state, context)
+        return probs.cpu().numpy(), state, context
+
+    def sequence(self, frames, state, context):
+        # Probabilities stay on the device until the end: one sync per call
+        probs = self.torch.empty(frames.shape[0], device=self.device)
+        with self.torch.no_grad():
+            for i in range(frames.shape[0]):
+                prob, state, context = self._step(frames[i:i + 1], state, context)
+                probs[i] = prob[0]
+        return probs.cpu().numpy(), state, context
+
+    def wrapper_prob(self, audio_chunk, sr):
+        """Scores a chunk through the model's own stateful wrapper (any supported rate)."""
+        if isinstance(audio_chunk, np.ndarray):
+            audio_chunk = self.torch.from_numpy(audio_chunk)
+        audio_tensor = audio_chunk.to(self.device)
+        if len(audio_tensor.shape) == 1:
+            audio_tensor = audio_tensor.unsqueeze(0)
+        return self.model(audio_tensor, sr).item()
+
+class OnnxSileroBackend:
+    """Silero ONNX model from a local file through ONNX Runtime on CPU; does not import torch."""
+    name = "onnx"
+
+    def __init__(self, model_path, intra_threads, inter_threads):
+        import onnxruntime as ort
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Silero VAD ONNX model not found at {model_path} (run scripts/download_models.py)")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.sr = np.array(16000, dtype=np.int64)
+        # Single-stream state for wrapper_prob(), like the torch model's own wrapper
+        self.wrapper_lock = threading.Lock()
+        self.wrapper_sr = None
+        self.wrapper_state = None
+        self.wrapper_context = None
+
+    def zeros(self, shape):
+        return np.zeros(shape, dtype=np.float32)
+
+    def concat(self, parts, axis):
+        return np.concatenate(parts, axis=axis)
+
+    def to_frames(self, audio):
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 1:
+            remainder = audio.shape[0] % CHUNK_SIZE
+            if remainder:
+                audio = np.pad(audio, (0, CHUNK_SIZE - remainder))
+            audio = audio.reshape(-1, CHUNK_SIZE)
+        return audio
+
+    def step(self, frames, state, context):
+        x = np.concatenate([context, frames], axis=1)
+        out, state = self.session.run(None, {"input": x, "state": state, "sr": self.sr})
+        return out.reshape(-1), state, x[:, -CONTEXT_SIZE:]
+
+    def sequence(self, frames, state, context):
+        probs = np.empty(frames.shape[0], dtype=np.float32)
+        for i in range(frames.shape[0]):
+            prob, state, context = self.step(frames[i:i + 1], state, context)
+            probs[i] = prob[0]
+        return probs, state, context
+
+    def wrapper_prob(self, audio_chunk, sr):
+        """
+        Scores a chunk at any rate Silero's own wrapper accepts: 8 kHz (256
+        samples) or 16 kHz and its multiples (decimated to 512 samples).
+        State is reset when the rate changes.
+        """
+        x = np.asarray(audio_chunk, dtype=np.float32).reshape(1, -1)
+        if sr != 16000 and sr % 16000 == 0:
+            x = x[:, ::sr // 16000]
+            sr = 16000
+        if sr not in (8000, 16000):
+            raise ValueError(f"Silero VAD supports 8000 Hz, 16000 Hz or multiples of 16000 Hz, not {sr}")
+        frame_size = CHUNK_SIZE if sr == 16000 else CHUNK_SIZE // 2
+        context_size = CONTEXT_SIZE if sr == 16000 else CONTEXT_SIZE // 2
+        if x.shape[1] != frame_size:
+            raise ValueError(f"Expected {frame_size} samples per chunk at {sr} Hz, got {x.shape[1]}")
+        with self.wrapper_lock:
+            if self.wrapper_sr != sr:
+                self.wrapper_sr = sr
+                self.wrapper_state = self.zeros((2, 1, 128))
+                self.wrapper_context = self.zeros((1, context_size))
+            x = np.concatenate([self.wrapper_context, x], axis=1)
+            out, self.wrapper_state = self.session.run(
+                None, {"input": x, "state": self.wrapper_state, "sr": np.array(sr, dtype=np.int64)}
+            )
+            self.wrapper_context = x[:, -context_size:]
+        return float(out.reshape(-1)[0])
+
+class VADDetector:
+    def __init__(self, threshold=0.5, backend=None):
+        self.threshold = threshold
+        backend = backend or VAD_BACKEND
+        print(f"Loading Silero VAD model ({backend})...")
+        if backend == "onnx":
+            self.backend = OnnxSileroBackend(VAD_ONNX_MODEL, VAD_INTRA_OP_THREADS, VAD_INTER_OP_THREADS)
+            self.device = "cpu"
+        elif backend == "torch":
+            self.backend = TorchSileroBackend(VAD_TORCH_THREADS)
+            self.device = self.backend.device
+        else:
+            raise ValueError(f"Unknown VAD backend: {backend}")
+        # State lives outside the model so one model can serve many streams
+        self.default_state = VADState(self.backend.zeros)
+        self.streams = {}
+        self.streams_lock = threading.Lock()
         print(f"VAD model loaded on {self.device}.")
 
-    def is_speech(self, audio_chunk, sr=16000):
+    def create_stream(self, stream_id=None):
+        """Registers a stream with fresh state and returns its id. All streams share the loaded model."""
+        stream_id = stream_id or uuid.uuid4().hex
+        with self.streams_lock:
+            if stream_id in self.streams:
+                raise ValueError(f"VAD stream {stream_id} already exists")
+            self.streams[stream_id] = VADState(self.backend.zeros)
+        return stream_id
+
+    def reset_stream(self, stream_id):
+        self.stream_state(stream_id).reset()
+
+    def drop_stream(self, stream_id):
+        with self.streams_lock:
+            self.streams.pop(stream_id, None)
+
+    def stream_state(self, stream_id):
+        with self.streams_lock:
+            state = self.streams.get(stream_id)
+        if state is None:
+            raise KeyError(f"Unknown VAD stream: {stream_id}")
+        return state
+
+    def _resolve(self, state):
+        """Accepts a VADState, a stream id or None (the detector's default state)."""
+        if state is None:
+            return self.default_state
+        if isinstance(state, VADState):
+            return state
+        return self.stream_state(state)
+
+    def speech_probs(self, audio, state=None, sr=16000):
+        """
+        Scores consecutive frames of one stream and returns a probability per frame.
+        audio: 1-D samples (tail zero-padded) or (N, 512) frames. On the torch
+        backend everything stays on the device until the end, so there is one sync
+        per call instead of one per frame. `state` (a VADState or stream id,
+        default: the detector's own) is advanced.
+        """
+        if sr != 16000:
+            raise ValueError("Batched VAD supports 16 kHz audio only")
+        state = self._resolve(state)
+        frames = self.backend.to_frames(audio)
+        with state.lock:
+            probs, h, context = self.backend.sequence(frames, state.state, state.context)
+            state.state[...] = h
+            state.context[...] = context
+        return probs
+
+    def speech_probs_batch(self, chunks, states, sr=16000):
+        """
+        Scores one frame for each of several streams in a single forward pass.
+        chunks: (B, 512) array or list of 512-sample arrays; states: B VADState
+        objects or stream ids, all distinct.
+        """
+        if sr != 16000:
+            raise ValueError("Batched VAD supports 16 kHz audio only")
+        if isinstance(chunks, (list, tuple)):
+            chunks = np.stack(chunks)
+        frames = self.backend.to_frames(chunks)
+        states = [self._resolve(s) for s in states]
+        if frames.shape[0] != len(states):
+            raise ValueError(f"Got {frames.shape[0]} frames for {len(states)} streams")
+        if len({id(s) for s in states}) != len(states):
+            raise ValueError("Each stream can appear only once per batch")
+        # Lock in a fixed order so concurrent batches can't deadlock
+        locked = sorted(states, key=id)
+        for s in locked:
+            s.lock.acquire()
+        try:
+            return self._batch_step(frames, states)
+        finally:
+            for s in locked:
+                s.lock.release()
+
+    def _batch_step(self, frames, states):
+        h = self.backend.concat([s.state for s in states], axis=1)
+        context = self.backend.concat([s.context for s in states], axis=0)
+        probs, h, context = self.backend.step(frames, h, context)
+        for i, s in enumerate(states):
+            s.state[...] = h[:, i:i + 1]
+            s.context[...] = context[i:i + 1]
+        return probs
+
+    def is_speech(self, audio_chunk, sr=16000, stream_id=None):
         """
         Returns True if the chunk contains speech.
         audio_chunk: numpy array of float32
+        stream_id: stream from create_stream(); None uses the detector's default stream
+        Other rates (8 kHz, multiples of 16 kHz) go through the backend's
+        single-stream wrapper on either backend and ignore stream_id.
         """
-        # Silero expects a torch tensor
-        if isinstance(audio_chunk, np.ndarray):
-            audio_tensor = torch.from_numpy(audio_chunk)
+        if sr != 16000:
+            speech_prob = self.backend.wrapper_prob(audio_chunk, sr)
         else:
-            audio_tensor = audio_chunk
-        
-        audio_tensor = audio_tensor.to(self.device)
-            
-        # Add batch dimension if needed: (1, L)
-        if len(audio_tensor.shape) == 1:
-            audio_tensor = audio_tensor.unsqueeze(0)
-
-        # Get speech probability
-        speech_prob = self.model(audio_tensor, sr).item()
-        
+            speech_prob = float(self.speech_probs(audio_chunk, stream_id)[-1])
         return speech_prob > self.threshold, speech_prob
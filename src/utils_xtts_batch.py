@@ -0,0 +1,135 @@
+import threading
+import torch
+import torch.nn.functional as F
+
+class GPTPassStats:
+    """How many sentences shared each batched GPT pass, to check that batches actually form."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.passes = 0
+        self.rows = 0
+        self.text_tokens = 0
+        self.pad_tokens = 0
+
+    def record(self, lengths, padded_len):
+        with self.lock:
+            self.passes += 1
+            self.rows += len(lengths)
+            self.text_tokens += sum(lengths)
+            self.pad_tokens += padded_len * len(lengths) - sum(lengths)
+
+    def stats(self):
+        with self.lock:
+            total = self.text_tokens + self.pad_tokens
+            return {
+                "gpt_passes": self.passes,
+                "avg_rows_per_pass": round(self.rows / self.passes, 2) if self.passes else None,
+                "pad_token_ratio": round(self.pad_tokens / total, 3) if total else None,
+            }
+
+def pad_text_tokens(token_lists, pad_token):
+    """Right-pads token lists to the longest one. Returns (IntTensor (B, L), lengths)."""
+    lengths = [len(tokens) for tokens in token_lists]
+    padded_len = max(lengths)
+    rows = [list(tokens) + [pad_token] * (padded_len - len(tokens)) for tokens in token_lists]
+    return torch.IntTensor(rows), lengths
+
+def text_attention_mask(lengths, padded_len, cond_len):
+    """
+    Attention mask over the GPT inputs XTTS builds from padded text:
+    [cond latents | start_text | text + pads | stop_text | start_audio].
+    Each row keeps its text and the first stop token after it (the one an
+    unpadded row would get) and hides the remaining pads.
+    """
+    mask = torch.ones(len(lengths), cond_len + padded_len + 3, dtype=torch.long)
+    for row, length in enumerate(lengths):
+        mask[row, cond_len + length + 2:cond_len + padded_len + 2] = 0
+    return mask
+
+def trim_at_stop(codes, stop_token):
+    """Cuts a (1, T) row of audio codes after its first stop token; finished rows of a batch are padded with it."""
+    stops = (codes[0] == stop_token).nonzero()
+    if len(stops):
+        codes = codes[:, :stops[0].item() + 1]
+    return codes
+
+@torch.inference_mode()
+def batched_inference(xtts, reqs, latents, split_sentences, max_batch_size=4, stats=None):
+    """
+    Runs several compatible requests (same language and sampling params)
+    through the XTTS GPT stage together and returns one float waveform per
+    request.
+
+    Mirrors Xtts.inference(): sentences from all requests are sorted by
+    text-token length and every `max_batch_size` neighbours go through
+    gpt.generate() as one batch. Shorter rows are padded with the stop text
+    token and masked out, so similar-length sentences from different requests
+    share a pass. Latent extraction and the HiFi-GAN decoder still run per
+    sentence. `latents` holds (gpt_cond_latent, speaker_embedding) per
+    request; `split_sentences(text, language, char_limit)` is XTTS's splitter.
+    """
+    first = reqs[0]
+    language = first.language.split("-")[0]
+    device = xtts.device
+    gpt = xtts.gpt
+
+    units = [] # (request index, sentence index, text tokens)
+    for i, req in enumerate(reqs):
+        sentences = split_sentences(req.text, language, xtts.tokenizer.char_limits[language])
+        for j, sent in enumerate(sentences):
+            tokens = xtts.tokenizer.encode(sent.strip().lower(), lang=language)
+            units.append((i, j, tokens))
+    # Neighbours in length order need the least padding
+    units.sort(key=lambda unit: len(unit[2]))
+
+    wavs = {}
+    for start in range(0, len(units), max_batch_size):
+        part = units[start:start + max_batch_size]
+        text_tokens, lengths = pad_text_tokens([unit[2] for unit in part], gpt.stop_text_token)
+        text_tokens = text_tokens.to(device)
+        cond_latents = torch.cat([latents[unit[0]][0].to(device) for unit in part], dim=0)
+        attention_mask = text_attention_mask(lengths, text_tokens.shape[-1], cond_latents.shape[1]).to(device)
+        if stats is not None:
+            stats.record(lengths, text_tokens.shape[-1])
+        gpt_codes = gpt.generate(
+            cond_latents=cond_latents,
+            text_inputs=text_tokens,
+            input_tokens=None,
+            attention_mask=attention_mask,
+            do_sample=True,
+            top_p=first.top_p,
+            top_k=first.top_k,
+            temperature=first.temperature,
+            num_return_sequences=1, # One sequence per input row, so row r belongs to part[r]
+            num_beams=1,
+            length_penalty=first.length_penalty,
+            repetition_penalty=first.repetition_penalty,
+            output_attentions=False,
+        )
+        for row, (i, j, _) in enumerate(part):
+            codes = trim_at_stop(gpt_codes[row:row + 1], gpt.stop_audio_token)
+            row_tokens = text_tokens[row:row + 1, :lengths[row]]
+            expected_output_len = torch.tensor([codes.shape[-1] * gpt.code_stride_len], device=device)
+            text_len = torch.tensor([row_tokens.shape[-1]], device=device)
+            gpt_latents = gpt(
+                row_tokens,
+                text_len,
+                codes,
+                expected_output_len,
+                cond_latents=cond_latents[row:row + 1],
+                return_attentions=False,
+                return_latent=True,
+            )
+            length_scale = 1.0 / max(reqs[i].speed, 0.05)
+            if length_scale != 1.0:
+                gpt_latents = F.interpolate(
+                    gpt_latents.transpose(1, 2), scale_factor=length_scale, mode="linear"
+                ).transpose(1, 2)
+            speaker_embedding = latents[i][1].to(device)
+            wavs[(i, j)] = xtts.hifigan_decoder(gpt_latents, g=speaker_embedding).cpu().squeeze()
+
+    results = []
+    for i in range(len(reqs)):
+        parts = [wavs[key] for key in sorted(k for k in wavs if k[0] == i)]
+        results.append(torch.cat(parts, dim=0).numpy())
+    return results
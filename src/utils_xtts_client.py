@@ -1,17 +1,74 @@
 import subprocess
+import threading
 import requests
+import struct
+import queue
 import os
 
+try:
+    from utils_http import get_shared_session, CONNECT_TIMEOUT
+    from utils_playback import AudioPlayer, WavStreamDecoder
+except ImportError:
+    from src.utils_http import get_shared_session, CONNECT_TIMEOUT
+    from src.utils_playback import AudioPlayer, WavStreamDecoder
+
+# "auto" plays in-process through sounddevice when available, "aplay" forces the subprocess
+PLAYBACK_MODE = os.getenv("XTTS_PLAYBACK", "auto")
+PLAYBACK_BUFFER_SECONDS = float(os.getenv("XTTS_PLAYBACK_BUFFER_SECONDS", "10"))
+
 class XTTSEngine:
     def __init__(self, server_url="http://127.0.0.1:8002"):
         self.server_url = server_url
         self.current_process = None
-        self.is_stopped = False
+        self.active_responses = set()
+        self.prefetches = set() # AudioPrefetch downloads not finished yet
+        self.responses_lock = threading.Lock()
+        self.stopped = threading.Event() # Set by stop(), cleared by start_turn()
+        self.session = get_shared_session()
+        self.timeout = (CONNECT_TIMEOUT, float(os.getenv("XTTS_READ_TIMEOUT", "60")))
+        self.player = None
+        self.player_failed = False
+        self.player_lock = threading.Lock()
         print("Initialized XTTS Engine (Client)")
 
+    def get_player(self):
+        """Opens the in-process output stream on first use. Returns None to use aplay."""
+        if PLAYBACK_MODE == "aplay" or self.player_failed or not AudioPlayer.available():
+            return None
+        with self.player_lock:
+            if self.player is None and not self.player_failed:
+                try:
+                    self.player = AudioPlayer(buffer_seconds=PLAYBACK_BUFFER_SECONDS)
+                except Exception as e:
+                    print(f"In-process playback unavailable, falling back to aplay: {e}")
+                    self.player_failed = True
+            return self.player
+
+    @property
+    def is_stopped(self):
+        return self.stopped.is_set()
+
+    def start_turn(self):
+        """Clears a previous stop(). Called once per spoken turn, before any of its audio is fetched."""
+        self.stopped.clear()
+
     def stop(self):
         """Stops the current audio playback immediately."""
-        self.is_stopped = True
+        # Set before the flush: the player rechecks it under its buffer lock
+        self.stopped.set()
+        # Abort in-flight downloads, including prefetches still connecting
+        with self.responses_lock:
+            responses = list(self.active_responses)
+            prefetches = list(self.prefetches)
+        for prefetch in prefetches:
+            prefetch.cancel()
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+        if self.player:
+            self.player.flush()
         if self.current_process:
             try:
                 self.current_process.terminate()
@@ -21,68 +78,70 @@ class XTTSEngine:
             finally:
                 self.current_process = None
 
+    def get_speaker_file(self, lang):
+        """Picks the reference voice for a language, falling back to speaker.wav."""
+        # XTTS supports: en, es, fr, de, it, pt, pl, tr, ru, nl, cs, ar, zh-cn, ja, ko, hu
+        # Whisper returns 'en', 'tr' etc. mostly matching.
+        speaker_file = "speaker.wav"
+
+        # Use specific samples if available
+        sample_dir = os.path.join(os.getcwd(), "models/xtts_v2/samples")
+        lang_code = lang.lower()
+        if lang_code in ("tr", "en"):
+            candidate = os.path.join(sample_dir, f"{lang_code}_sample.wav")
+            if os.path.exists(candidate):
+                speaker_file = candidate
+        return speaker_file
+
+    def iter_audio(self, text, lang="en", chunk_size=4096, **kwargs):
+        """
+        Yields WAV bytes from the streaming endpoint as they are synthesized.
+        The first chunk starts with a WAV header whose data size is open-ended.
+        """
+        payload = {
+            "text": text,
+            "language": lang,
+            "speaker_wav": self.get_speaker_file(lang),
+            **kwargs
+        }
+        with self.session.post(f"{self.server_url}/synthesize/stream", json=payload, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with self.responses_lock:
+                self.active_responses.add(response)
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        yield chunk
+            finally:
+                with self.responses_lock:
+                    self.active_responses.discard(response)
+
     def speak(self, text, lang="en"):
         if not text:
             return
-            
-        self.is_stopped = False
+        # print(f"XTTS Request ({lang}): {text[:30]}...")
+        self.start_turn()
+        self.play_chunks(self.iter_audio(text, lang))
+        self.wait_until_played()
+
+    def wait_until_played(self, stop_event=None):
+        """Blocks until queued in-process audio has been played (aplay already blocks in play_chunks)."""
+        if self.player:
+            self.player.wait_until_played(stop_event)
+
+    def play_chunks(self, chunks):
+        """
+        Plays an iterable of WAV bytes (header first) as they arrive. With the
+        in-process player this returns once the audio is queued, so the next
+        sentence joins without a gap; use wait_until_played() to block.
+        Does nothing after stop() until the next start_turn().
+        """
         try:
-            # Map lang codes if necessary
-            # XTTS supports: en, es, fr, de, it, pt, pl, tr, ru, nl, cs, ar, zh-cn, ja, ko, hu
-            # Whisper returns 'en', 'tr' etc. mostly matching.
-            
-            # Determine speaker file
-            # Default to generic speaker.wav
-            speaker_file = "speaker.wav"
-            
-            # Use specific samples if available
-            sample_dir = os.path.join(os.getcwd(), "models/xtts_v2/samples")
-            lang_code = lang.lower()
-            if lang_code == "tr":
-                candidate = os.path.join(sample_dir, "tr_sample.wav")
-                if os.path.exists(candidate):
-                    speaker_file = candidate
-            elif lang_code == "en":
-                candidate = os.path.join(sample_dir, "en_sample.wav")
-                if os.path.exists(candidate):
-                    speaker_file = candidate
-            
-            payload = {
-                "text": text,
-                "language": lang,
-                "speaker_wav": speaker_file
-            }
-            
-            # print(f"XTTS Request ({lang}): {text[:30]}...")
-            
-            # Use requests to get audio
-            with requests.post(f"{self.server_url}/synthesize", json=payload, stream=True) as response:
-                response.raise_for_status()
-                
-                # Play streaming audio
-                # For now, it returns full wav. Stream to aplay.
-                self.current_process = subprocess.Popen(['aplay', '-q'], stdin=subprocess.PIPE)
-                
-                try:
-                    for chunk in response.iter_content(chunk_size=4096):
-                        if self.is_stopped:
-                            break
-                        if chunk and self.current_process and self.current_process.stdin:
-                            self.current_process.stdin.write(chunk)
-                except (BrokenPipeError, OSError):
-                    # Process likely killed by stop()
-                    pass
-                finally:
-                    if self.current_process:
-                        try:
-                            if self.current_process.stdin:
-                                self.current_process.stdin.flush()
-                                self.current_process.stdin.close()
-                            self.current_process.wait()
-                        except (BrokenPipeError, OSError):
-                            pass
-                        self.current_process = None
-            
+            player = self.get_player()
+            if player is not None:
+                self._queue_chunks(player, chunks)
+            else:
+                self._play_with_aplay(chunks)
         except requests.exceptions.RequestException as e:
             # Only print if not manually stopped
             if not self.is_stopped:
@@ -91,36 +150,190 @@ class XTTSEngine:
             if not self.is_stopped:
                 print(f"XTTS Error: {e}")
 
-    def synthesize_audio(self, text, lang="en", **kwargs):
-        """Returns the audio bytes (wav) directly."""
+    def _queue_chunks(self, player, chunks):
+        decoder = WavStreamDecoder()
+        for chunk in chunks:
+            if self.is_stopped:
+                break
+            samples = decoder.feed(chunk)
+            if len(samples) and not player.write(samples, decoder.sample_rate or 24000, self.stopped):
+                break # Flushed by stop()
+
+    def _play_with_aplay(self, chunks):
+        try:
+            for chunk in chunks:
+                if self.is_stopped:
+                    break
+                if self.current_process is None:
+                    # aplay starts playing as soon as the header and first PCM chunk arrive
+                    self.current_process = subprocess.Popen(['aplay', '-q'], stdin=subprocess.PIPE)
+                if self.current_process and self.current_process.stdin:
+                    self.current_process.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            # Process likely killed by stop()
+            pass
+        finally:
+            if self.current_process:
+                try:
+                    if self.current_process.stdin:
+                        self.current_process.stdin.flush()
+                        self.current_process.stdin.close()
+                    self.current_process.wait()
+                except (BrokenPipeError, OSError):
+                    pass
+                self.current_process = None
+
+    def synthesize_audio(self, text, lang="en", stream=False, **kwargs):
+        """
+        Returns the audio bytes (wav) directly. By default this goes through
+        /synthesize, where concurrent requests are micro-batched; stream=True
+        collects /synthesize/stream instead (never batched).
+        """
         if not text:
             return None
-            
+
         try:
-            # Determine speaker file similar to speak()
-            speaker_file = "speaker.wav"
-            sample_dir = os.path.join(os.getcwd(), "models/xtts_v2/samples")
-            lang_code = lang.lower()
-            if lang_code == "tr":
-                candidate = os.path.join(sample_dir, "tr_sample.wav")
-                if os.path.exists(candidate):
-                    speaker_file = candidate
-            elif lang_code == "en":
-                candidate = os.path.join(sample_dir, "en_sample.wav")
-                if os.path.exists(candidate):
-                    speaker_file = candidate
-            
+            if stream:
+                # Collect the streamed response and patch the header sizes
+                # so the result is a regular, seekable WAV file.
+                audio = bytearray()
+                for chunk in self.iter_audio(text, lang, **kwargs):
+                    audio.extend(chunk)
+                if len(audio) < 44:
+                    return None
+                struct.pack_into("<I", audio, 4, len(audio) - 8)
+                struct.pack_into("<I", audio, 40, len(audio) - 44)
+                return bytes(audio)
+
             payload = {
                 "text": text,
                 "language": lang,
-                "speaker_wav": speaker_file,
+                "speaker_wav": self.get_speaker_file(lang),
                 **kwargs
             }
-            
-            with requests.post(f"{self.server_url}/synthesize", json=payload, stream=False) as response:
+
+            with self.session.post(f"{self.server_url}/synthesize", json=payload, stream=False, timeout=self.timeout) as response:
                 response.raise_for_status()
                 return response.content
-            
+
         except Exception as e:
             print(f"XTTS Synthesis Error: {e}")
             return None
+
+class AudioPrefetch:
+    """
+    Downloads one sentence's streamed audio on a background thread. It is
+    registered with the engine before connecting, so XTTSEngine.stop()
+    cancels it at any stage.
+    """
+    def __init__(self, engine, text, lang):
+        self.engine = engine
+        self.chunk_queue = queue.Queue()
+        self.cancelled = threading.Event()
+        with engine.responses_lock:
+            engine.prefetches.add(self)
+        if engine.is_stopped:
+            self.cancel()
+        self.thread = threading.Thread(target=self._run, args=(text, lang), daemon=True)
+        self.thread.start()
+
+    def _run(self, text, lang):
+        try:
+            if self.cancelled.is_set():
+                return
+            for chunk in self.engine.iter_audio(text, lang):
+                if self.cancelled.is_set():
+                    break
+                self.chunk_queue.put(chunk)
+        except Exception as e:
+            if not self.cancelled.is_set() and not self.engine.is_stopped:
+                print(f"XTTS Prefetch Error: {e}")
+        finally:
+            with self.engine.responses_lock:
+                self.engine.prefetches.discard(self)
+            self.chunk_queue.put(None)
+
+    def chunks(self):
+        """Yields downloaded chunks, waiting for more until the sentence is complete or cancelled."""
+        while not self.cancelled.is_set():
+            try:
+                chunk = self.chunk_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            yield chunk
+
+    def cancel(self):
+        self.cancelled.set()
+
+class SpeechPipeline:
+    """
+    Speaks a stream of sentences without gaps.
+
+    say() hands a sentence to a synthesis thread, which starts fetching its
+    audio right away (at most `lookahead` sentences ahead of playback), and a
+    playback thread plays the fetched sentences in order. Setting
+    `stop_event` (plus XTTSEngine.stop()) cancels all pending work.
+    """
+    def __init__(self, tts, lang, stop_event, lookahead=2):
+        tts.start_turn()
+        self.tts = tts
+        self.lang = lang
+        self.stop_event = stop_event
+        self.sentences = queue.Queue()
+        self.ready = queue.Queue()
+        self.slots = threading.Semaphore(lookahead + 1) # Playing sentence + lookahead
+        self.synth_thread = threading.Thread(target=self._synthesize_loop, daemon=True)
+        self.playback_thread = threading.Thread(target=self._playback_loop, daemon=True)
+        self.synth_thread.start()
+        self.playback_thread.start()
+
+    def say(self, sentence):
+        self.sentences.put(sentence)
+
+    def finish(self):
+        """Waits until everything queued has been played (or the pipeline was stopped)."""
+        self.sentences.put(None)
+        while self.playback_thread.is_alive():
+            self.playback_thread.join(timeout=0.05)
+        self.tts.wait_until_played(self.stop_event)
+
+    def _acquire_slot(self):
+        while not self.stop_event.is_set():
+            if self.slots.acquire(timeout=0.05):
+                return True
+        return False
+
+    def _synthesize_loop(self):
+        while True:
+            sentence = self.sentences.get()
+            if sentence is None or not self._acquire_slot() or self.stop_event.is_set():
+                break
+            self.ready.put(AudioPrefetch(self.tts, sentence, self.lang))
+        self.ready.put(None)
+
+    def _playback_loop(self):
+        while True:
+            try:
+                prefetch = self.ready.get(timeout=0.05)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    break
+                continue
+            if prefetch is None:
+                break
+            if self.stop_event.is_set():
+                prefetch.cancel()
+                break
+            self.tts.play_chunks(prefetch.chunks())
+            self.slots.release()
+
+        # Drop anything fetched ahead of an interrupted playback
+        while True:
+            try:
+                prefetch = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            if prefetch is not None:
+                prefetch.cancel()
@@ -26,8 +26,15 @@ torch.load = unsafe_load
 
 import uvicorn
 from fastapi import FastAPI, Response, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 import io
+import time
+import struct
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
 import scipy.io.wavfile
 
@@ -49,6 +56,10 @@ torchaudio.load = safe_audio_load
 # Import XTTS classes directly
 from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
+from TTS.tts.layers.xtts.tokenizer import split_sentence
+
+from utils_inference import InferencePool, BatchScheduler, QueueFullError, DeadlineExceededError, bound_replica
+from utils_xtts_batch import GPTPassStats, batched_inference as run_gpt_batches
 
 print("Initializing XTTS Server (Local)...")
 
@@ -76,6 +87,171 @@ except Exception as e:
     print(f"Error initializing Local XTTS: {e}")
     exit(1)
 
+# XTTS keeps per-call state on the model (the GPT's cached conditioning
+# prefix), so each inference worker thread gets its own replica
+XTTS_WORKERS = max(1, int(os.getenv("XTTS_WORKERS", "1")))
+replicas = [model]
+for i in range(1, XTTS_WORKERS):
+    print(f"Loading model replica {i + 1}/{XTTS_WORKERS}...")
+    replica = Xtts.init_from_config(config)
+    replica.load_checkpoint(config, checkpoint_dir=MODEL_PATH, eval=True)
+    replicas.append(replica.to(DEVICE))
+
+def current_model():
+    """The replica bound to the calling inference worker; the primary model on other threads."""
+    return bound_replica(model)
+
+class LatentCache:
+    """
+    LRU cache of speaker conditioning latents.
+
+    Entries are keyed by speaker path + mtime + size so an edited reference
+    file is picked up automatically. Latents are also persisted to disk under
+    a content hash, so a restarted server does not re-encode the reference audio.
+    """
+    def __init__(self, max_size=8, cache_dir=None):
+        self.max_size = max(1, max_size)
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _content_hash(self, path):
+        sha = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def _load_from_disk(self, digest):
+        if not self.cache_dir:
+            return None
+        cache_file = os.path.join(self.cache_dir, f"{digest}.pth")
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            data = torch.load(cache_file, map_location=DEVICE)
+            return data["gpt_cond_latent"], data["speaker_embedding"]
+        except Exception as e:
+            print(f"Ignoring unreadable latent cache file {cache_file}: {e}")
+            return None
+
+    def _save_to_disk(self, digest, latents):
+        if not self.cache_dir:
+            return
+        cache_file = os.path.join(self.cache_dir, f"{digest}.pth")
+        tmp_file = cache_file + ".tmp"
+        try:
+            gpt_cond_latent, speaker_embedding = latents
+            torch.save({
+                "gpt_cond_latent": gpt_cond_latent.cpu(),
+                "speaker_embedding": speaker_embedding.cpu()
+            }, tmp_file)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            print(f"Failed to persist speaker latents: {e}")
+
+    def get(self, speaker_wav):
+        """Returns (gpt_cond_latent, speaker_embedding) for the given reference file."""
+        path = os.path.abspath(speaker_wav)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            latents = self.entries.get(key)
+            if latents is not None:
+                self.entries.move_to_end(key)
+                return latents
+
+        digest = self._content_hash(path)
+        latents = self._load_from_disk(digest)
+        if latents is None:
+            print(f"Computing speaker latents for {path}...")
+            latents = current_model().get_conditioning_latents(audio_path=[path])
+            self._save_to_disk(digest, latents)
+            print("Speaker latents computed.")
+        else:
+            print(f"Loaded cached speaker latents for {path}.")
+
+        with self.lock:
+            # Drop stale entries for the same file (older mtime/size)
+            for stale in [k for k in self.entries if k[0] == path and k != key]:
+                del self.entries[stale]
+            self.entries[key] = latents
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return latents
+
+latent_cache = LatentCache(
+    max_size=int(os.getenv("XTTS_LATENT_CACHE_SIZE", "8")),
+    cache_dir=os.getenv("XTTS_LATENT_CACHE_DIR", os.path.join(MODEL_PATH, "latents"))
+)
+
+SAMPLE_RATE = 24000
+# Number of GPT tokens per streamed chunk (smaller = lower latency, more overhead)
+STREAM_CHUNK_SIZE = int(os.getenv("XTTS_STREAM_CHUNK_SIZE", "20"))
+
+def to_int16(wav):
+    """Converts a float waveform (tensor or array) to int16 compatible with aplay/standard wav."""
+    if isinstance(wav, torch.Tensor):
+        wav = wav.squeeze().cpu().numpy()
+    wav_norm = np.asarray(wav)
+    return (wav_norm * 32767).clip(-32768, 32767).astype(np.int16)
+
+def wav_header(sample_rate=SAMPLE_RATE, channels=1, bits_per_sample=16, data_size=0xFFFFFFFF - 36):
+    """
+    RIFF/WAVE header for streamed PCM. The default (maximum) data size tells
+    players like aplay to read until EOF since the final length is unknown.
+    """
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", data_size + 36, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample,
+        b"data", data_size
+    )
+
+inference_pool = InferencePool(
+    replicas,
+    name="xtts-infer",
+    max_queue=int(os.getenv("XTTS_MAX_QUEUE", "8")),
+    timeout=float(os.getenv("XTTS_REQUEST_TIMEOUT", "60"))
+)
+
+def batch_key(req):
+    """Requests can share a GPT pass only if language and sampling params match."""
+    return (req.language, req.temperature, req.length_penalty, req.repetition_penalty, req.top_k, req.top_p)
+
+gpt_pass_stats = GPTPassStats()
+
+def batched_inference(reqs):
+    """Batched GPT pass over compatible requests on this worker's replica; see utils_xtts_batch."""
+    latents = [latent_cache.get(req.speaker_wav) for req in reqs]
+    return run_gpt_batches(current_model(), reqs, latents, split_sentence, MAX_BATCH_SIZE, gpt_pass_stats)
+
+def encode_wav(wav):
+    buffer = io.BytesIO()
+    scipy.io.wavfile.write(buffer, SAMPLE_RATE, to_int16(wav))
+    return buffer.getvalue()
+
+def run_batched_inference(reqs):
+    """BatchScheduler batch runner: one WAV per request."""
+    print(f"Synthesizing batch of {len(reqs)} [{reqs[0].language}]...")
+    return [encode_wav(wav) for wav in batched_inference(reqs)]
+
+MAX_BATCH_SIZE = int(os.getenv("XTTS_MAX_BATCH_SIZE", "4"))
+batch_scheduler = BatchScheduler(
+    inference_pool,
+    lambda req: run_inference(req), # Defined below
+    run_batched_inference,
+    batch_key,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=float(os.getenv("XTTS_BATCH_WAIT_MS", "15"))
+) if MAX_BATCH_SIZE > 1 else None
+
 app = FastAPI()
 
 class SynthesisRequest(BaseModel):
@@ -89,6 +265,129 @@ class SynthesisRequest(BaseModel):
     top_p: float = 0.85
     speed: float = 1.0
 
+def run_inference(req):
+    """Blocking XTTS inference, returns a complete WAV. Runs on the inference pool."""
+    # XTTS Inference using model directly
+    # Latents are cached per speaker file (memory + disk)
+    gpt_cond_latent, speaker_embedding = latent_cache.get(req.speaker_wav)
+    
+    # Inference
+    print(f"Starting Inference (temp={req.temperature}, speed={req.speed})...")
+    out = current_model().inference(
+        req.text,
+        req.language,
+        gpt_cond_latent,
+        speaker_embedding,
+        enable_text_splitting=True,
+        temperature=req.temperature,
+        length_penalty=req.length_penalty,
+        repetition_penalty=req.repetition_penalty,
+        top_k=req.top_k,
+        top_p=req.top_p,
+        speed=req.speed
+    )
+    print("Inference completed.")
+    
+    return encode_wav(out['wav'])
+
+def run_inference_stream(req, emit, cancelled):
+    """Blocking streaming inference. Pushes PCM chunks through emit() until done or cancelled."""
+    if cancelled.is_set():
+        return
+    gpt_cond_latent, speaker_embedding = latent_cache.get(req.speaker_wav)
+    chunks = current_model().inference_stream(
+        req.text,
+        req.language,
+        gpt_cond_latent,
+        speaker_embedding,
+        stream_chunk_size=STREAM_CHUNK_SIZE,
+        enable_text_splitting=True,
+        temperature=req.temperature,
+        length_penalty=req.length_penalty,
+        repetition_penalty=req.repetition_penalty,
+        top_k=req.top_k,
+        top_p=req.top_p,
+        speed=req.speed
+    )
+    for chunk in chunks:
+        if cancelled.is_set():
+            print("Streaming cancelled by client.")
+            return
+        emit(to_int16(chunk).tobytes())
+    print("Streaming completed.")
+
+# Languages synthesized once at startup so the first real request doesn't pay
+# kernel warmup and latent computation. Empty disables warmup.
+WARMUP_LANGUAGES = [lang.strip() for lang in os.getenv("XTTS_WARMUP_LANGUAGES", "en,tr").split(",") if lang.strip()]
+WARMUP_PHRASES = {
+    "en": "Hello, how can I help you today?",
+    "tr": "Merhaba, size nasıl yardımcı olabilirim?",
+}
+warmup_status = {"state": "pending", "seconds": None, "replicas": 0, "languages": {}}
+
+def warmup_speaker_file(lang):
+    """Same reference voice the client (XTTSEngine.get_speaker_file) sends, so its latents get cached."""
+    candidate = os.path.join(os.getcwd(), "models/xtts_v2/samples", f"{lang.lower()}_sample.wav")
+    if lang.lower() in ("tr", "en") and os.path.exists(candidate):
+        return candidate
+    return "speaker.wav"
+
+def warm_replica(barrier):
+    """One worker's warmup: synthesizes a short phrase per language (complete + streamed once) on its replica."""
+    try:
+        # Hold this worker until every worker has taken a warmup job, so each replica gets exactly one
+        barrier.wait(timeout=600)
+    except threading.BrokenBarrierError:
+        print("Warmup: not every worker picked up a warmup job")
+    results = {}
+    for index, lang in enumerate(WARMUP_LANGUAGES):
+        started = time.monotonic()
+        try:
+            req = SynthesisRequest(text=WARMUP_PHRASES.get(lang, "Hello."), language=lang, speaker_wav=warmup_speaker_file(lang))
+            run_inference(req)
+            if index == 0:
+                run_inference_stream(req, lambda _chunk: None, threading.Event())
+            results[lang] = {"ok": True, "seconds": round(time.monotonic() - started, 2)}
+        except Exception as e:
+            print(f"Warmup failed for [{lang}]: {e}")
+            results[lang] = {"ok": False, "error": str(e)}
+    return results
+
+def run_warmup():
+    """Warms every model replica with one job per inference worker; ready once all of them have finished."""
+    warmup_status["state"] = "warming"
+    started = time.monotonic()
+    barrier = threading.Barrier(inference_pool.workers)
+    futures = []
+    for _ in range(inference_pool.workers):
+        try:
+            futures.append(inference_pool.submit(warm_replica, barrier, timeout=600))
+        except Exception as e:
+            print(f"Warmup job could not be queued: {e}")
+            barrier.abort() # Don't keep the submitted jobs waiting for it
+    warmup_status["replicas"] = len(futures)
+    for future in futures:
+        try:
+            results = future.result()
+        except Exception as e:
+            results = {lang: {"ok": False, "error": str(e)} for lang in WARMUP_LANGUAGES}
+        # Report the slowest (or a failed) replica per language
+        for lang, result in results.items():
+            previous = warmup_status["languages"].get(lang)
+            if previous is None or (previous["ok"] and (not result["ok"] or result["seconds"] > previous["seconds"])):
+                warmup_status["languages"][lang] = result
+    warmup_status["seconds"] = round(time.monotonic() - started, 2)
+    # A failed warmup only costs latency, the model itself is usable
+    warmup_status["state"] = "ready"
+    print(f"XTTS warmup of {len(futures)} replica(s) finished in {warmup_status['seconds']}s")
+
+@app.on_event("startup")
+async def start_warmup():
+    if WARMUP_LANGUAGES:
+        threading.Thread(target=run_warmup, name="xtts-warmup", daemon=True).start()
+    else:
+        warmup_status["state"] = "ready"
+
 @app.post("/synthesize")
 async def synthesize(req: SynthesisRequest):
     if not req.text.strip():
@@ -101,44 +400,90 @@ async def synthesize(req: SynthesisRequest):
     print(f"Synthesizing [{req.language}]: {req.text[:50]}...")
     
     try:
-        # XTTS Inference using model directly
-        # We need to compute latents first
-        print("Computing speaker latents...")
-        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
-            audio_path=[req.speaker_wav]
-        )
-        print("Speaker latents computed.")
-        
-        # Inference
-        print(f"Starting Inference (temp={req.temperature}, speed={req.speed})...")
-        out = model.inference(
-            req.text,
-            req.language,
-            gpt_cond_latent,
-            speaker_embedding,
-            enable_text_splitting=True,
-            temperature=req.temperature,
-            length_penalty=req.length_penalty,
-            repetition_penalty=req.repetition_penalty,
-            top_k=req.top_k,
-            top_p=req.top_p,
-            speed=req.speed
-        )
-        print("Inference completed.")
-        
-        # Convert to int16 compatible with aplay/standard wav
-        wav_norm = np.array(out['wav'])
-        wav_int16 = (wav_norm * 32767).clip(-32768, 32767).astype(np.int16)
-        
-        buffer = io.BytesIO()
-        scipy.io.wavfile.write(buffer, 24000, wav_int16)
-        buffer.seek(0)
-        
-        return Response(content=buffer.read(), media_type="audio/wav")
-        
+        if batch_scheduler:
+            wav_bytes = await batch_scheduler.run(req)
+        else:
+            wav_bytes = await inference_pool.run(run_inference, req)
+        return Response(content=wav_bytes, media_type="audio/wav")
+    except QueueFullError as e:
+        print(f"Rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceededError as e:
+        print(f"Timed out: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Inference Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/synthesize/stream")
+async def synthesize_stream(req: SynthesisRequest):
+    """
+    Streams a WAV (24 kHz, mono, int16) as XTTS produces it.
+    The header is sent first with an open-ended data size, followed by raw PCM chunks.
+    """
+    if not req.text.strip():
+        return Response(content=wav_header(data_size=0), media_type="audio/wav")
+
+    if not os.path.exists(req.speaker_wav):
+        raise HTTPException(status_code=400, detail="Speaker wav not found")
+
+    print(f"Streaming [{req.language}]: {req.text[:50]}...")
+
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def emit(chunk):
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+    try:
+        future = inference_pool.submit(run_inference_stream, req, emit, cancelled)
+    except QueueFullError as e:
+        print(f"Rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    # End-of-stream marker, also sent if the job fails or expires before starting
+    future.add_done_callback(lambda _future: emit(None))
+
+    async def generate():
+        yield wav_header()
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            # Surface errors from the worker (headers are already sent,
+            # so we can only log and end the stream early)
+            await asyncio.wrap_future(future)
+        except DeadlineExceededError as e:
+            print(f"Timed out: {e}")
+        except Exception as e:
+            print(f"Streaming Inference Error: {e}")
+        finally:
+            cancelled.set()
+
+    return StreamingResponse(generate(), media_type="audio/wav")
+
+@app.get("/health")
+async def health():
+    """Liveness: the model is loaded before the server starts listening, so answering means it is usable."""
+    return {"status": "ok", "device": DEVICE, "warmup": warmup_status["state"]}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the startup warmup has finished, 503 before."""
+    if warmup_status["state"] != "ready":
+        return JSONResponse({"status": "warming", "warmup": warmup_status}, status_code=503)
+    return {"status": "ready", "device": DEVICE, "warmup": warmup_status}
+
+@app.get("/stats")
+async def stats():
+    """Queue depth and latency of the inference pool and batcher."""
+    result = inference_pool.stats()
+    if batch_scheduler:
+        result["batching"] = batch_scheduler.stats()
+        result["batching"].update(gpt_pass_stats.stats())
+    return result
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8002)
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_endpoint import Endpointer
+
+SPEECH = 0.6
+SILENCE = 0.0
+HESITANT = 0.3 # Below the 0.5 threshold, but above half of it
+
+def make_endpointer(language="en", **kwargs):
+    return Endpointer(min_silence_ms=300, max_silence_ms=1000, frame_ms=100, threshold=0.5, language=language, **kwargs)
+
+def end_of_turn_ms(endpointer, probs, partial_text="", text_current=True):
+    """Feeds frames; returns the silence (ms) at which the turn ended, or None."""
+    for prob in probs:
+        if endpointer.update(prob, partial_text, text_current):
+            return endpointer.silence_ms
+    return None
+
+@pytest.mark.parametrize("language, partial_text, text_current, silence_prob, expected_ms", [
+    # Sentence-final punctuation and questions end after the minimum
+    ("en", "I am done.", True, SILENCE, 300),
+    ("en", "That is great!", True, SILENCE, 300),
+    ("en", "Are you there?", True, SILENCE, 300),
+    ("tr", "Geliyor musun", True, SILENCE, 300),
+    # Trailing punctuation and continuation words wait the maximum
+    ("en", "I went to the store,", True, SILENCE, 1000),
+    ("en", "I went to the store and", True, SILENCE, 1000),
+    ("tr", "Markete gittim ve", True, SILENCE, 1000),
+    # Continuation words only count for the stream's language
+    ("en", "Markete gittim ve", True, SILENCE, 700),
+    # No cue: halfway between min and max (650 ms, frame aligned)
+    ("en", "I went home", True, SILENCE, 700),
+    ("en", "", True, SILENCE, 700),
+    # A stale transcript is not used as a cue
+    ("en", "I am done.", False, SILENCE, 700),
+    # Hesitant frames extend the window by 25%, capped at the maximum
+    ("en", "I am done.", True, HESITANT, 400),
+    ("en", "I went to the store and", True, HESITANT, 1000),
+])
+def test_required_silence_follows_the_cues(language, partial_text, text_current, silence_prob, expected_ms):
+    endpointer = make_endpointer(language)
+    probs = [SPEECH] + [silence_prob] * 20
+    assert end_of_turn_ms(endpointer, probs, partial_text, text_current) == expected_ms
+
+def test_speech_resets_the_silence_count():
+    endpointer = make_endpointer()
+    probs = [SPEECH] + [SILENCE] * 2 + [SPEECH] + [SILENCE] * 2
+    assert end_of_turn_ms(endpointer, probs, "I am done.") is None
+    assert end_of_turn_ms(endpointer, [SILENCE], "I am done.") == 300
+
+def test_long_pausers_get_a_longer_window():
+    endpointer = make_endpointer()
+    # Three 600 ms pauses mid-turn, each too short to end it without a cue
+    for _ in range(3):
+        assert end_of_turn_ms(endpointer, [SPEECH] + [SILENCE] * 6) is None
+    assert list(endpointer.pause_history) == [600, 600]
+    assert end_of_turn_ms(endpointer, [SPEECH] + [SILENCE] * 6) is None
+    assert len(endpointer.pause_history) == 3
+    # Sentence end now needs 75% of the median pause (450 ms) instead of 300 ms
+    assert end_of_turn_ms(endpointer, [SPEECH] + [SILENCE] * 10, "I am done.") == 500
+
+def test_decisions_are_logged(tmp_path):
+    log_path = tmp_path / "endpoint.jsonl"
+    endpointer = make_endpointer(log_path=str(log_path))
+    assert end_of_turn_ms(endpointer, [SPEECH] + [SILENCE] * 5, "Are you there?") == 300
+    record = json.loads(log_path.read_text(encoding="utf-8"))
+    assert record["cue"] == "question"
+    assert record["required_ms"] == 300
+    assert record["text_tail"] == "Are you there?"
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_inference import InferencePool, BatchScheduler, QueueFullError, bound_replica
+
+class Recorder:
+    """run_one / run_batch stand-ins that record how requests were grouped."""
+    def __init__(self, gate=None):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.gate = gate
+
+    def run_one(self, req):
+        if self.gate:
+            self.gate.wait(5)
+        with self.lock:
+            self.calls.append([req["text"]])
+        return f"wav:{req['text']}"
+
+    def run_batch(self, reqs):
+        with self.lock:
+            self.calls.append([req["text"] for req in reqs])
+        return [f"wav:{req['text']}" for req in reqs]
+
+def make_scheduler(recorder, replicas=("model",), max_queue=8, max_batch_size=4, max_wait_ms=200):
+    pool = InferencePool(list(replicas), max_queue=max_queue, timeout=10)
+    scheduler = BatchScheduler(
+        pool,
+        recorder.run_one,
+        recorder.run_batch,
+        key=lambda req: req["language"],
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms
+    )
+    return pool, scheduler
+
+def test_concurrent_requests_are_coalesced_into_one_batch():
+    recorder = Recorder()
+    pool, scheduler = make_scheduler(recorder)
+    reqs = [{"text": f"sentence {i}", "language": "en"} for i in range(4)]
+
+    async def main():
+        # Same path as concurrent /synthesize calls
+        return await asyncio.gather(*(scheduler.run(req) for req in reqs))
+
+    results = asyncio.run(main())
+
+    assert results == [f"wav:sentence {i}" for i in range(4)]
+    assert len(recorder.calls) == 1
+    assert sorted(recorder.calls[0]) == [req["text"] for req in reqs]
+    assert scheduler.stats()["avg_batch_size"] == 4
+    assert pool.stats()["completed"] == 1
+
+def test_incompatible_requests_are_grouped_by_key():
+    recorder = Recorder()
+    _, scheduler = make_scheduler(recorder)
+    reqs = [
+        {"text": "a", "language": "en"},
+        {"text": "b", "language": "tr"},
+        {"text": "c", "language": "en"},
+    ]
+
+    async def main():
+        return await asyncio.gather(*(scheduler.run(req) for req in reqs))
+
+    assert asyncio.run(main()) == ["wav:a", "wav:b", "wav:c"]
+    assert sorted(sorted(call) for call in recorder.calls) == [["a", "c"], ["b"]]
+
+def test_batcher_and_direct_jobs_share_admission():
+    gate = threading.Event()
+    recorder = Recorder(gate)
+    pool, scheduler = make_scheduler(recorder, max_queue=1, max_batch_size=2, max_wait_ms=1)
+    try:
+        first = scheduler.submit({"text": "a", "language": "en"})
+        second = pool.submit(lambda: gate.wait(5) and "direct")
+        # Capacity is one worker + one queued request, across both paths
+        with pytest.raises(QueueFullError):
+            scheduler.submit({"text": "b", "language": "en"})
+        with pytest.raises(QueueFullError):
+            pool.submit(lambda: "direct")
+        assert pool.stats()["rejected"] == 2
+    finally:
+        gate.set()
+    assert first.result(5) == "wav:a"
+    assert second.result(5) == "direct"
+
+def test_each_worker_gets_its_own_replica():
+    pool = InferencePool(["replica-0", "replica-1"], max_queue=0, timeout=10)
+    barrier = threading.Barrier(2)
+
+    def job():
+        # Both jobs must run at the same time, so they are on different threads
+        barrier.wait(5)
+        return bound_replica()
+
+    futures = [pool.submit(job), pool.submit(job)]
+    assert sorted(future.result(5) for future in futures) == ["replica-0", "replica-1"]
+    assert bound_replica("primary") == "primary"
@@ -0,0 +1,126 @@
+import os
+import struct
+import sys
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_playback import PCMRingBuffer, StreamResampler, WavStreamDecoder
+
+def samples(start, count):
+    return np.arange(start, start + count, dtype=np.float32)
+
+def read(ring, count):
+    out = np.full(count, -1.0, dtype=np.float32)
+    ring.read_into(out)
+    return out.tolist()
+
+def test_ring_buffer_wraps_around():
+    ring = PCMRingBuffer(8)
+    assert ring.write(samples(0, 6))
+    assert read(ring, 4) == [0, 1, 2, 3]
+    # 5 more samples: 2 fit before the end of the array, 3 wrap to the start
+    assert ring.write(samples(6, 5))
+    assert ring.available == 7
+    assert read(ring, 7) == [4, 5, 6, 7, 8, 9, 10]
+
+def test_ring_buffer_pads_underflow_with_silence():
+    ring = PCMRingBuffer(8)
+    ring.write(samples(1, 3))
+    assert read(ring, 5) == [1, 2, 3, 0, 0]
+    assert ring.available == 0
+
+def test_blocked_writer_resumes_when_space_frees():
+    ring = PCMRingBuffer(4)
+    ring.write(samples(0, 4))
+    result = {}
+    writer = threading.Thread(target=lambda: result.update(ok=ring.write(samples(4, 2))))
+    writer.start()
+    time.sleep(0.05)
+    assert writer.is_alive()
+    assert read(ring, 2) == [0, 1]
+    writer.join(1)
+    assert result["ok"]
+    assert read(ring, 4) == [2, 3, 4, 5]
+
+def test_clear_aborts_a_blocked_writer():
+    ring = PCMRingBuffer(4)
+    ring.write(samples(0, 4))
+    result = {}
+    writer = threading.Thread(target=lambda: result.update(ok=ring.write(samples(4, 8))))
+    writer.start()
+    time.sleep(0.05)
+    ring.clear()
+    writer.join(1)
+    assert result["ok"] is False
+    # Nothing of the aborted write is left to play
+    assert ring.available == 0
+
+def test_write_for_an_old_generation_is_dropped():
+    ring = PCMRingBuffer(8)
+    generation = ring.generation
+    ring.clear()
+    assert ring.write(samples(0, 4), generation=generation) is False
+    assert ring.available == 0
+
+def test_write_after_stop_is_dropped():
+    # A writer that checked its stop flag before stop() must not queue audio after the flush
+    ring = PCMRingBuffer(8)
+    stopped = threading.Event()
+    stopped.set()
+    ring.clear()
+    assert ring.write(samples(0, 4), stop_event=stopped) is False
+    assert ring.available == 0
+
+def test_wait_until_empty_honours_stop_event():
+    ring = PCMRingBuffer(8)
+    ring.write(samples(0, 4))
+    stopped = threading.Event()
+    stopped.set()
+    assert ring.wait_until_empty(stopped) is False
+    read(ring, 4)
+    assert ring.wait_until_empty() is True
+
+def test_resampler_is_continuous_across_chunks():
+    audio = np.sin(np.arange(2400, dtype=np.float32) / 10).astype(np.float32)
+    whole = StreamResampler(24000, 48000).process(audio)
+    resampler = StreamResampler(24000, 48000)
+    chunked = np.concatenate([resampler.process(audio[i:i + 333]) for i in range(0, len(audio), 333)])
+    assert len(chunked) == len(whole)
+    assert np.allclose(chunked, whole, atol=1e-6)
+
+def wav_bytes(pcm, sample_rate=24000, channels=1, extra_chunk=b""):
+    """Open-ended PCM16 WAV like the XTTS server streams, optionally with a chunk before "fmt "."""
+    header = struct.pack("<4sI4s", b"RIFF", 0xFFFFFFFF, b"WAVE") + extra_chunk
+    header += struct.pack(
+        "<4sIHHIIHH", b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * channels * 2, channels * 2, 16
+    )
+    header += struct.pack("<4sI", b"data", 0xFFFFFFFF - 36)
+    return header + pcm.astype("<i2").tobytes()
+
+PCM = np.array([0, 16384, -16384, 32767, -32768, 8192], dtype=np.int16)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 44, 45, 1000])
+def test_wav_decoder_handles_header_and_samples_split_across_chunks(chunk_size):
+    # An odd-sized LIST chunk is padded to an even length
+    data = wav_bytes(PCM, extra_chunk=struct.pack("<4sI", b"LIST", 3) + b"abc\x00")
+    decoder = WavStreamDecoder()
+    decoded = []
+    for start in range(0, len(data), chunk_size):
+        out = decoder.feed(data[start:start + chunk_size])
+        if decoder.sample_rate is None:
+            assert len(out) == 0
+        decoded.extend(out.tolist())
+    assert decoder.sample_rate == 24000
+    assert decoded == (PCM.astype(np.float32) / 32768.0).tolist()
+
+def test_wav_decoder_downmixes_stereo():
+    stereo = np.array([1000, 3000, -2000, 2000], dtype=np.int16)
+    out = WavStreamDecoder().feed(wav_bytes(stereo, sample_rate=16000, channels=2))
+    assert out.tolist() == [2000 / 32768.0, 0.0]
@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faster_whisper")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_stt import StreamingTranscriber, SAMPLE_RATE
+
+# (start, end, word) in utterance time
+UTTERANCE = [
+    (0.0, 0.4, " Hello"), (0.5, 0.9, " there"), (1.0, 1.3, " my"), (1.4, 1.9, " friend"),
+    (2.0, 2.3, " how"), (2.4, 2.6, " are"), (2.7, 3.0, " you"),
+]
+
+class FakeEngine:
+    """
+    Fed audio carries its own sample index, so the fake knows which part of
+    the utterance a window covers and returns the words inside it, relative
+    to the window start. `replace` rewrites words to simulate an unstable decode.
+    """
+    def __init__(self):
+        self.calls = []
+        self.replace = {}
+        self.lock = threading.Lock()
+
+    def transcribe_words(self, audio, language=None, initial_prompt=None, vad_filter=True, **kwargs):
+        with self.lock:
+            self.calls.append({"samples": len(audio), "prompt": initial_prompt, "vad_filter": vad_filter})
+        start = audio[0] / SAMPLE_RATE if len(audio) else 0.0
+        end = start + len(audio) / SAMPLE_RATE
+        words = [
+            (w_start - start, w_end - start, self.replace.get(word, word))
+            for w_start, w_end, word in UTTERANCE
+            if w_start >= start - 1e-6 and w_end <= end + 1e-6
+        ]
+        return words, "en"
+
+def feed_until(transcriber, seconds, is_speech=True):
+    """Feeds utterance audio up to `seconds` in 100 ms chunks."""
+    fed = int(round(transcriber.total_seconds * SAMPLE_RATE))
+    until = int(round(seconds * SAMPLE_RATE))
+    for start in range(fed, until, SAMPLE_RATE // 10):
+        chunk = np.arange(start, min(start + SAMPLE_RATE // 10, until), dtype=np.float32)
+        transcriber.feed(chunk, is_speech)
+
+def partial_decode(transcriber):
+    """Runs one partial decode on the worker and waits for its result to be applied."""
+    expected = transcriber.total_seconds
+    transcriber.request_partial()
+    deadline = time.monotonic() + 5
+    while abs(transcriber.decoded_until - expected) > 1e-6:
+        assert time.monotonic() < deadline, "partial decode did not finish"
+        time.sleep(0.005)
+
+def make_transcriber(engine, **kwargs):
+    # Partials only on request, so the test controls when they run
+    return StreamingTranscriber(engine, language="en", step_ms=60000, **kwargs)
+
+def test_words_are_committed_once_two_hypotheses_agree():
+    engine = FakeEngine()
+    transcriber = make_transcriber(engine)
+    try:
+        feed_until(transcriber, 1.0)
+        partial_decode(transcriber)
+        # A single hypothesis is never committed
+        assert transcriber.committed_text == ""
+        assert transcriber.partial_text == "Hello there"
+
+        feed_until(transcriber, 2.0)
+        partial_decode(transcriber)
+        assert transcriber.committed_text == "Hello there"
+        assert transcriber.partial_text == "Hello there my friend"
+        # Audio up to the last committed word is dropped from the window
+        assert transcriber.window_offset == pytest.approx(0.9)
+        assert engine.calls[-1]["prompt"] is None
+    finally:
+        transcriber.close()
+
+def test_committed_words_are_never_rewritten():
+    engine = FakeEngine()
+    transcriber = make_transcriber(engine)
+    try:
+        feed_until(transcriber, 1.0)
+        partial_decode(transcriber)
+        feed_until(transcriber, 2.0)
+        partial_decode(transcriber)
+
+        # The next decode disagrees about the uncommitted words
+        engine.replace = {" my": " me"}
+        feed_until(transcriber, 2.5)
+        partial_decode(transcriber)
+        assert transcriber.committed_text == "Hello there"
+        assert transcriber.partial_text == "Hello there me friend how"
+        # Later decodes only see the uncommitted window, with the committed text as prompt
+        assert engine.calls[-1]["prompt"] == "Hello there"
+        assert engine.calls[-1]["samples"] == int(1.6 * SAMPLE_RATE)
+    finally:
+        transcriber.close()
+
+def test_disagreeing_hypotheses_are_committed_once_the_window_is_too_long():
+    engine = FakeEngine()
+    transcriber = make_transcriber(engine, max_window_s=1.5)
+    try:
+        engine.replace = {" Hello": " Hallo", " there": " their"}
+        feed_until(transcriber, 1.4)
+        partial_decode(transcriber)
+        assert transcriber.committed_text == ""
+        engine.replace = {}
+        feed_until(transcriber, 2.5)
+        partial_decode(transcriber)
+        # Nothing agreed, so all but the last two words are forced out
+        assert transcriber.committed_text == "Hello there my"
+        assert transcriber.partial_text == "Hello there my friend how"
+    finally:
+        transcriber.close()
+
+def test_finish_decodes_the_speech_tail_without_vad():
+    engine = FakeEngine()
+    transcriber = make_transcriber(engine, trailing_pad_ms=200)
+    feed_until(transcriber, 1.0)
+    partial_decode(transcriber)
+    feed_until(transcriber, 2.0)
+    partial_decode(transcriber)
+    feed_until(transcriber, 3.0)
+    feed_until(transcriber, 4.0, is_speech=False)
+
+    text, language = transcriber.finish()
+
+    assert text == "Hello there my friend how are you"
+    assert language == "en"
+    final = engine.calls[-1]
+    assert final["vad_filter"] is False
+    assert final["prompt"] == "Hello there"
+    # Window start (0.9 s) to last speech (3.0 s) plus the 200 ms trailing pad
+    assert final["samples"] == int(round((3.2 - 0.9) * SAMPLE_RATE))
+
+def test_finish_without_partials_decodes_everything():
+    engine = FakeEngine()
+    transcriber = make_transcriber(engine)
+    feed_until(transcriber, 3.0)
+    assert transcriber.finish() == ("Hello there my friend how are you", "en")
+    assert len(engine.calls) == 1
@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faster_whisper")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import utils_stt_service
+from utils_stt_service import STTService, _Job, SAMPLE_RATE, MAX_BATCH_SECONDS
+
+@pytest.fixture(autouse=True)
+def all_speech(monkeypatch):
+    """The synthetic audio is not speech to Silero; treat all of it as speech unless a test says otherwise."""
+    monkeypatch.setattr(utils_stt_service, "find_speech", lambda audio: [{"start": 0, "end": len(audio)}])
+
+def utterance(tag, seconds=1.0):
+    """Audio whose samples all carry `tag`, so the fake engine can tell requests apart."""
+    return np.full(int(seconds * SAMPLE_RATE), tag, dtype=np.float32)
+
+def tier_for(tag):
+    return "fast" if tag < 10 else "accurate"
+
+class FakeEngine:
+    """TieredSTTEngine stand-in; `gate` holds single decodes until the test releases it."""
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.calls = []
+
+    def transcribe_with_tier(self, audio, language=None, presegmented=False):
+        if self.gate:
+            self.gate.wait(5)
+        tag = int(audio[0])
+        self.calls.append(("one", [tag], presegmented))
+        return f"one:{tag}", language or "en", tier_for(tag)
+
+    def transcribe_batch_with_tier(self, audios, language):
+        tags = [int(audio[0]) for audio in audios]
+        self.calls.append(("batch", tags, [len(audio) for audio in audios]))
+        return [(f"batch:{tag}", tier_for(tag)) for tag in tags]
+
+def queue_behind_blocker(service, engine, requests):
+    """Keeps the single worker busy while `requests` (tag, language, seconds) are queued."""
+    blocker = service.submit(utterance(0), language=None)
+    futures = [service.submit(utterance(tag, seconds), language) for tag, language, seconds in requests]
+    engine.gate.set()
+    assert blocker.result(5).text == "one:0"
+    return [future.result(5) for future in futures]
+
+def test_queued_requests_are_batched_by_language():
+    engine = FakeEngine(threading.Event())
+    service = STTService(engine, num_workers=1, max_batch_size=8, max_wait_ms=50)
+    results = queue_behind_blocker(service, engine, [
+        (1, "en", 1.0), (2, "tr", 1.0), (3, "en", 1.0), (4, "en", MAX_BATCH_SECONDS + 1), (5, "en", 1.0),
+    ])
+
+    # Short English requests share a batch; Turkish and over-long audio go alone
+    assert [call[:2] for call in engine.calls[1:]] == [("batch", [1, 3, 5]), ("one", [2]), ("one", [4])]
+    assert [result.text for result in results] == ["batch:1", "one:2", "batch:3", "one:4", "batch:5"]
+    assert [result.batch_size for result in results] == [3, 1, 3, 1, 3]
+    stats = service.stats()
+    assert stats["batches"] == 1
+    assert stats["batched_requests"] == 3
+
+def test_batches_are_capped_at_max_batch_size():
+    engine = FakeEngine(threading.Event())
+    service = STTService(engine, num_workers=1, max_batch_size=2, max_wait_ms=50)
+    queue_behind_blocker(service, engine, [(1, "en", 1.0), (2, "en", 1.0), (3, "en", 1.0)])
+    assert [call[:2] for call in engine.calls[1:]] == [("batch", [1, 2]), ("one", [3])]
+
+def test_jobs_without_language_are_not_batched():
+    engine = FakeEngine(threading.Event())
+    service = STTService(engine, num_workers=1, max_batch_size=8, max_wait_ms=50)
+    queue_behind_blocker(service, engine, [(1, None, 1.0), (2, None, 1.0)])
+    assert [call[:2] for call in engine.calls[1:]] == [("one", [1]), ("one", [2])]
+
+def test_job_speech_crops_unless_presegmented(monkeypatch):
+    monkeypatch.setattr(utils_stt_service, "find_speech", lambda audio: [{"start": 100, "end": 1100}])
+    audio = utterance(1)
+
+    assert len(_Job(audio, "en", presegmented=False).speech()) == 1000
+    assert _Job(audio, "en", presegmented=True).speech() is audio
+
+def test_batched_path_crops_only_unsegmented_audio(monkeypatch):
+    monkeypatch.setattr(utils_stt_service, "find_speech", lambda audio: [{"start": 0, "end": 1600}])
+    engine = FakeEngine(threading.Event())
+    service = STTService(engine, num_workers=1, max_batch_size=8, max_wait_ms=50)
+    blocker = service.submit(utterance(0))
+    raw = service.submit(utterance(1), "en")
+    segmented = service.submit(utterance(2), "en", presegmented=True)
+    engine.gate.set()
+    for future in (blocker, raw, segmented):
+        future.result(5)
+
+    assert engine.calls[1] == ("batch", [1, 2], [1600, SAMPLE_RATE])
+
+def test_single_requests_pass_presegmented_through():
+    engine = FakeEngine()
+    service = STTService(engine, num_workers=1)
+    service.transcribe(utterance(1), "en", presegmented=True)
+    service.transcribe(utterance(2), "en")
+    assert [call[2] for call in engine.calls] == [True, False]
+
+def test_tiers_are_propagated_to_results_and_stats():
+    engine = FakeEngine(threading.Event())
+    service = STTService(engine, num_workers=1, max_batch_size=8, max_wait_ms=50)
+    results = queue_behind_blocker(service, engine, [(1, "en", 1.0), (20, "en", 1.0), (30, "tr", 1.0)])
+
+    assert [result.tier for result in results] == ["fast", "accurate", "accurate"]
+    # The blocker (tag 0) was decoded by the fast tier too
+    assert service.stats()["tiers"] == {"fast": 2, "accurate": 2}
+
+def test_engine_errors_fail_every_job_of_the_batch():
+    class FailingEngine(FakeEngine):
+        def transcribe_batch_with_tier(self, audios, language):
+            raise RuntimeError("decoder crashed")
+
+    engine = FailingEngine(threading.Event())
+    service = STTService(engine, num_workers=1, max_batch_size=8, max_wait_ms=50)
+    blocker = service.submit(utterance(0))
+    futures = [service.submit(utterance(tag), "en") for tag in (1, 2)]
+    engine.gate.set()
+    blocker.result(5)
+    for future in futures:
+        with pytest.raises(RuntimeError, match="decoder crashed"):
+            future.result(5)
+    assert service.stats()["failed"] == 2
@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_text import TextChunker
+
+def stream(chunker, text, step=3):
+    """Feeds text in small token-like pieces, then flushes at end of stream."""
+    chunks = []
+    for start in range(0, len(text), step):
+        chunks.extend(chunker.feed(text[start:start + step]))
+    return chunks + chunker.flush()
+
+def test_first_sentence_is_emitted_as_soon_as_it_ends():
+    chunker = TextChunker("en")
+    assert chunker.feed("Hello there, how are you") == []
+    assert chunker.feed("?") == []
+    assert chunker.feed(" I am") == ["Hello there, how are you?"]
+    assert chunker.flush() == ["I am"]
+
+def test_period_waits_for_the_next_word():
+    chunker = TextChunker("en")
+    assert chunker.feed("We can meet at the station. ") == []
+    # A lowercase continuation would have meant an abbreviation or ordinal
+    assert chunker.feed("Then") == ["We can meet at the station."]
+
+def test_later_sentences_are_merged_up_to_the_target():
+    text = "This is the first one. Second sentence here. Third sentence here. Fourth one."
+    chunks = stream(TextChunker("en", target_chars=50), text)
+    assert chunks == ["This is the first one.", "Second sentence here. Third sentence here.", "Fourth one."]
+
+def test_abbreviations_and_initials_do_not_split():
+    text = "I met Dr. Smith and J. Doe at the U.S. office today. Then we left for home."
+    chunks = stream(TextChunker("en", target_chars=20), text)
+    assert chunks == ["I met Dr. Smith and J. Doe at the U.S. office today.", "Then we left for home."]
+
+def test_decimals_do_not_split():
+    chunks = stream(TextChunker("en"), "Pi is roughly 3.14 in most cases. Yes.")
+    assert chunks == ["Pi is roughly 3.14 in most cases.", "Yes."]
+
+def test_turkish_ordinals_and_abbreviations_do_not_split():
+    text = "Takımımız ligde 1. sırada bitirdi. Örn. bu yıl da öyle."
+    chunks = stream(TextChunker("tr"), text)
+    assert chunks == ["Takımımız ligde 1. sırada bitirdi.", "Örn. bu yıl da öyle."]
+
+def test_flush_returns_an_unterminated_tail():
+    chunker = TextChunker("en")
+    assert chunker.feed("No punctuation at all") == []
+    assert chunker.flush() == ["No punctuation at all"]
+    assert chunker.flush() == []
+
+def test_flush_emits_a_trailing_sentence_end_held_for_lookahead():
+    chunker = TextChunker("en")
+    # "now." could still be an abbreviation until the next word arrives
+    assert chunker.feed("It is done now.") == []
+    assert chunker.flush() == ["It is done now."]
+
+def test_no_chunk_exceeds_max_chars():
+    text = " ".join(["word"] * 120)
+    chunks = stream(TextChunker("en", target_chars=100, max_chars=100), text, step=7)
+    assert " ".join(chunks) == text
+    assert all(len(chunk) <= 100 for chunk in chunks)
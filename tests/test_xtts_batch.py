@@ -0,0 +1,103 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_xtts_batch import GPTPassStats, batched_inference
+
+STOP_TEXT = 0
+STOP_AUDIO = 99
+
+class FakeGPT:
+    """Emits codes tagged with each row's first text token; even tokens stop early."""
+    stop_text_token = STOP_TEXT
+    stop_audio_token = STOP_AUDIO
+    code_stride_len = 1024
+
+    def __init__(self):
+        self.generate_calls = []
+
+    def generate(self, cond_latents, text_inputs, attention_mask=None, num_return_sequences=1, **kwargs):
+        self.generate_calls.append((text_inputs.clone(), attention_mask.clone(), num_return_sequences))
+        rows = []
+        for tokens in text_inputs.tolist():
+            tag = tokens[0]
+            # Rows that finish first are padded with the stop token, like HF generate()
+            rows.append([tag, tag, STOP_AUDIO, STOP_AUDIO, STOP_AUDIO] if tag % 2 == 0 else [tag] * 4 + [STOP_AUDIO])
+        return torch.tensor(rows)
+
+    def __call__(self, text_tokens, text_len, codes, expected_output_len, cond_latents=None, **kwargs):
+        # The per-row pass must see the unpadded text
+        assert STOP_TEXT not in text_tokens[0].tolist()
+        assert text_len.item() == text_tokens.shape[-1]
+        return torch.full((1, codes.shape[-1], 2), float(codes[0, 0]))
+
+class FakeTokenizer:
+    char_limits = {"en": 250}
+
+    def encode(self, text, lang):
+        return [int(word) for word in text.split()]
+
+class FakeXtts:
+    device = "cpu"
+
+    def __init__(self):
+        self.gpt = FakeGPT()
+        self.tokenizer = FakeTokenizer()
+
+    def hifigan_decoder(self, latents, g=None):
+        return latents[:, :, 0].unsqueeze(1)
+
+def split_sentences(text, language, char_limit):
+    return text.split("|")
+
+def make_request(text):
+    return SimpleNamespace(
+        text=text, language="en", speed=1.0, temperature=0.75, top_p=0.85, top_k=50,
+        length_penalty=1.0, repetition_penalty=5.0
+    )
+
+def test_sentences_of_different_lengths_share_a_padded_pass():
+    xtts = FakeXtts()
+    reqs = [make_request("2 7|4"), make_request("6 1 1"), make_request("3")]
+    latents = [(torch.zeros(1, 2, 4), torch.zeros(1, 8, 1)) for _ in reqs]
+    stats = GPTPassStats()
+
+    wavs = batched_inference(xtts, reqs, latents, split_sentences, max_batch_size=4, stats=stats)
+
+    # Every row keeps its codes up to and including the first stop token
+    assert wavs[0].tolist() == [2.0] * 3 + [4.0] * 3
+    assert wavs[1].tolist() == [6.0] * 3
+    assert wavs[2].tolist() == [3.0] * 5
+
+    assert len(xtts.gpt.generate_calls) == 1
+    text_inputs, mask, num_return_sequences = xtts.gpt.generate_calls[0]
+    assert num_return_sequences == 1
+    # Sorted by length, right-padded with the stop text token
+    assert text_inputs.tolist() == [[4, 0, 0], [3, 0, 0], [2, 7, 0], [6, 1, 1]]
+    # cond (2) + start_text + 3 tokens + stop_text + start_audio; pads hidden
+    assert mask.tolist() == [
+        [1, 1, 1, 1, 1, 0, 0, 1],
+        [1, 1, 1, 1, 1, 0, 0, 1],
+        [1, 1, 1, 1, 1, 1, 0, 1],
+        [1, 1, 1, 1, 1, 1, 1, 1],
+    ]
+    assert stats.stats() == {"gpt_passes": 1, "avg_rows_per_pass": 4.0, "pad_token_ratio": 0.417}
+
+def test_rows_beyond_max_batch_size_go_to_another_pass():
+    xtts = FakeXtts()
+    reqs = [make_request("2|4|6"), make_request("8 8")]
+    latents = [(torch.zeros(1, 2, 4), torch.zeros(1, 8, 1)) for _ in reqs]
+    stats = GPTPassStats()
+
+    wavs = batched_inference(xtts, reqs, latents, split_sentences, max_batch_size=2, stats=stats)
+
+    assert wavs[0].tolist() == [2.0] * 3 + [4.0] * 3 + [6.0] * 3
+    assert wavs[1].tolist() == [8.0] * 3
+    assert [call[0].shape[0] for call in xtts.gpt.generate_calls] == [2, 2]
+    assert stats.stats()["avg_rows_per_pass"] == 2.0
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils_xtts_client import XTTSEngine
+
+class FakeResponse:
+    content = b"RIFF-wav"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+
+    def post(self, url, **kwargs):
+        self.urls.append(url)
+        return FakeResponse()
+
+def test_whole_wav_synthesis_uses_the_batched_endpoint():
+    engine = XTTSEngine()
+    engine.session = FakeSession()
+
+    assert engine.synthesize_audio("Hello there.", lang="en", speed=1.5) == b"RIFF-wav"
+    # /synthesize goes through the server's BatchScheduler; /synthesize/stream does not
+    assert engine.session.urls == [f"{engine.server_url}/synthesize"]